@@ -0,0 +1,52 @@
+from saulscript import Context
+from saulscript.clock import clock
+from saulscript.generator import generate
+from saulscript.runtime import Bundle, write_bundle
+import logging
+import os
+import resource
+import sys
+import tempfile
+
+logging.basicConfig(level=logging.ERROR)
+
+# Server start with every installed script compiled up front against
+# opening a precompiled bundle, and the cost of the first and later
+# runs of a bundled script.
+#
+# usage: bench_bundle.py [scripts] [statements per script] [compile|bundle]
+num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+statements = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+mode = sys.argv[3] if len(sys.argv) > 3 else 'bundle'
+
+sources = dict(('script%d' % i, generate(statements=statements, seed=i))
+               for i in range(num_scripts))
+path = os.path.join(tempfile.mkdtemp(), 'scripts.bundle')
+started = clock()
+write_bundle(path, sources)
+print "wrote %d scripts in %.2fs, %.1fKB" % (
+    num_scripts, clock() - started, os.path.getsize(path) / 1024.0)
+
+# ru_maxrss is in kilobytes on linux
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = clock()
+if mode == 'compile':
+    context = Context()
+    scripts = dict((script_id, context.compile(src))
+                   for script_id, src in sources.iteritems())
+else:
+    scripts = Bundle(path)
+startup = clock() - started
+grown = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+print "%s: startup %.3fs, peak memory grew %.1fMB" % (mode, startup,
+                                                     grown / 1024.0)
+
+runs = []
+for i in range(2):
+    started = clock()
+    scripts['script0'].execute(Context())
+    runs.append(clock() - started)
+print "first run %.3fms, second run %.3fms" % (runs[0] * 1000,
+                                               runs[1] * 1000)
+os.unlink(path)
+os.rmdir(os.path.dirname(path))
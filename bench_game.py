@@ -0,0 +1,115 @@
+from decimal import Decimal
+from saulscript import Context, HostBindings
+from saulscript.clock import clock
+from saulscript.exceptions import OperationLimitReached, TimeLimitReached, \
+    MemoryLimitReached
+from saulscript.runtime.stats import summarize
+import logging
+import resource
+import sys
+
+logging.basicConfig(level=logging.ERROR)
+
+# A game server tick: every entity runs its script once per tick under
+# op and time limits. size scales loop counts and data tables.
+#
+# usage: bench_game.py [scripts] [ticks] [size] [op limit] [time limit]
+num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+num_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+size = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+op_limit = int(sys.argv[4]) if len(sys.argv) > 4 else 5000
+time_limit = float(sys.argv[5]) if len(sys.argv) > 5 else 0.05
+
+PATROL = '''
+steps = 0
+while steps < %(loop)d
+    target = nearest(pos)
+    if target > 3
+        pos = pos + 1
+        moved = moved + 1
+    end if
+    steps = steps + 1
+end while
+'''
+
+SHOP = '''
+prices = {%(prices)s}
+total = 0
+for item in prices
+    total = total + prices[item] * stock(item)
+end for
+rich = total < gold
+if rich
+    tell("buying")
+end if
+'''
+
+DUEL = '''
+score = function(a, b) {
+    return a * 2 + b
+}
+best = 0
+i = 0
+while i < %(loop)d
+    s = score(i, roll(i))
+    if s > best
+        best = s
+    end if
+    i = i + 1
+end while
+'''
+
+
+def sources(size):
+    prices = ', '.join('item%d: %d' % (i, i % 9 + 1) for i in range(size * 2))
+    values = {'loop': size, 'prices': prices}
+    return [template % values for template in (PATROL, SHOP, DUEL)]
+
+
+bindings = HostBindings()
+bindings.bind_function('nearest', lambda pos: Decimal(int(pos) % 7),
+                       pure=True)
+bindings.bind_function('roll', lambda n: Decimal(int(n) * 7919 % 13),
+                       pure=True)
+bindings.bind_function('stock', lambda item: Decimal(len(item) % 4),
+                       pure=True)
+bindings.bind_function('tell', lambda message: None)
+bindings.freeze()
+
+base = Context(bindings=bindings)
+trees = [base.compile(src) for src in sources(size)]
+
+entities = []
+for i in range(num_scripts):
+    context = Context(bindings=bindings)
+    context.bind_value('pos', Decimal(i))
+    context.bind_value('moved', Decimal(0))
+    context.bind_value('gold', Decimal(i * 10))
+    entities.append((context, trees[i % len(trees)]))
+
+latencies = []
+operations = 0
+failed = 0
+started = clock()
+for tick in range(num_ticks):
+    for context, tree in entities:
+        run_started = clock()
+        context.reset_instrumentation()
+        try:
+            tree.execute(context, op_limit=op_limit, time_limit=time_limit)
+        except (OperationLimitReached, TimeLimitReached, MemoryLimitReached):
+            failed += 1
+        latencies.append(clock() - run_started)
+        operations += context.operations_counted
+elapsed = clock() - started
+
+latency = summarize(latencies)
+# ru_maxrss is in kilobytes on linux
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+print "%d scripts, %d ticks, size %d: %.0f runs/s, %.0f ops/s" % (
+    num_scripts, num_ticks, size, len(latencies) / elapsed,
+    operations / elapsed)
+print "latency p50 %.3fms p95 %.3fms p99 %.3fms max %.3fms" % (
+    latency['p50'] * 1000, latency['p95'] * 1000, latency['p99'] * 1000,
+    latency['max'] * 1000)
+print "%d runs hit a limit, peak memory %.1fMB" % (failed, peak)
@@ -0,0 +1,34 @@
+from saulscript.generator import generate
+from saulscript.runtime import load_directory
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+logging.basicConfig(level=logging.ERROR)
+
+# Load a generated directory of scripts with a growing number of
+# processes, the load time should drop with each added core.
+#
+# usage: bench_load.py [scripts] [statements per script] [processes,...]
+num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+statements = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+counts = [int(n) for n in (sys.argv[3] if len(sys.argv) > 3
+                           else '1,2,4').split(',')]
+
+path = tempfile.mkdtemp()
+for i in range(num_scripts):
+    with open(os.path.join(path, 'script%d.lv' % i), 'w') as f:
+        f.write(generate(statements=statements, seed=i))
+
+try:
+    serial = None
+    for processes in counts:
+        result = load_directory(path, processes=processes)
+        serial = serial or result.elapsed
+        print "%2d processes: %.2fs, %.1f scripts/s, %.1fx" % (
+            processes, result.elapsed, num_scripts / result.elapsed,
+            serial / result.elapsed)
+finally:
+    shutil.rmtree(path)
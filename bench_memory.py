@@ -0,0 +1,50 @@
+from saulscript import Context
+from saulscript.generator import generate
+from saulscript.syntax_tree import Interner, nodes
+from bench_scaling import deep_sizeof
+import gc
+import logging
+import sys
+
+logging.basicConfig(level=logging.ERROR)
+
+# Bytes held by the syntax trees of resident scripts.
+#
+# usage: bench_memory.py [scripts] [statements per script] [interning]
+#
+# interning is off, lines (share nodes on the same line) or all
+num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+statements = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+interning = sys.argv[3] if len(sys.argv) > 3 else 'off'
+
+
+def count_nodes(root):
+    seen = set()
+    stack = [root]
+    count = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, (nodes.Node, nodes.Branch, nodes.ListNode)):
+            count += 1
+        stack.extend(child for child in gc.get_referents(obj)
+                     if isinstance(child, (nodes.Node, tuple, list, dict)))
+    return count
+
+
+context = Context()
+if interning != 'off':
+    context.set_interner(Interner(ignore_lines=interning == 'all'))
+trees = []
+for seed in range(num_scripts):
+    src = generate(statements=statements, seed=seed)
+    trees.append(context.compile(src).tree)
+
+total = deep_sizeof(trees)
+num_nodes = count_nodes(trees)
+print "%d scripts of %d statements: %.1fKB per script, %.1f bytes per node" % (
+    num_scripts, statements, total / 1024.0 / num_scripts,
+    float(total) / num_nodes)
+print "%d nodes, %.1fMB in total" % (num_nodes, total / 1024.0 / 1024.0)
@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from saulscript import Context
+from saulscript.lexer import Lexer
+from saulscript.syntax_tree import SyntaxTree, nodes
+import argparse
+import json
+import logging
+import sys
+import timeit
+
+logging.basicConfig(level=logging.ERROR)
+
+# Microbenchmarks for the lexer, the parser and every kind of node.
+# Results are seconds per unit (per character lexed, per statement
+# parsed, per statement reduced), lower is better.
+#
+# usage: bench_micro.py [--save baseline.json] [--compare baseline.json]
+#                       [--threshold 0.1] [--only name]
+
+SCRIPT = '''
+menu = {
+    tacos: 10, burritos: 20
+}
+specials = ['twelve', 'thirteen', 'five']
+example = function(arg, arg2) {
+    hello = 10 * arg + arg2
+    return hello
+}
+result = example(10, 20)
+val = 0
+while val < 10
+    val = val + 1
+end while
+worf = 0
+for x in menu
+    worf = worf + menu.burritos
+end for
+menu['empanadas'] = menu.tacos + menu['burritos']
+'''
+
+SETUP = '''
+a = 7
+b = 3
+s = "abc"
+l = [1, 2, 3]
+d = {k: 1}
+f = function(x) {
+    return x
+}
+'''
+
+# name -> expression, the expression node alone is reduced
+EXPRESSION_CASES = OrderedDict([
+    ('number', '1'),
+    ('string', '"abc"'),
+    ('boolean', 'true'),
+    ('variable', 'a'),
+    ('addition', 'a + b'),
+    ('subtraction', 'a - b'),
+    ('multiplication', 'a * b'),
+    ('division', 'a / b'),
+    ('exponent', 'a ** b'),
+    ('comparison', 'a == b'),
+    ('less_than', 'a < b'),
+    ('greater_than', 'a > b'),
+    ('subscript', 'l[1]'),
+    ('dot_notation', 'd.k'),
+    ('dict_literal', '{one: 1, two: 2, three: 3}'),
+    ('list_literal', '[1, 2, 3]'),
+    ('function_definition', 'function(y) {\n    return y\n}'),
+    ('function_call', 'f(a)'),
+    ('host_call', 'h(a)'),
+])
+
+# nodes the parser can't produce from source yet
+BUILT_CASES = OrderedDict([
+    ('negation', lambda: nodes.NegationNode(0, nodes.VariableNode(0, 'a'))),
+    ('less_than_equal', lambda: nodes.LessThanEqualToNode(
+        0, nodes.VariableNode(0, 'a'), nodes.VariableNode(0, 'b'))),
+    ('greater_than_equal', lambda: nodes.GreaterThanEqualToNode(
+        0, nodes.VariableNode(0, 'a'), nodes.VariableNode(0, 'b'))),
+])
+
+# name -> statements, reduced as they are
+STATEMENT_CASES = OrderedDict([
+    ('nop', '\n'),
+    ('assignment', 'x = a'),
+    ('subscript_assignment', 'l[1] = a'),
+    ('if', 'if a > b\n    x = 1\nend if'),
+    ('while', 'while a < b\n    x = 1\nend while'),
+    ('for', 'for y in l\n    x = y\nend for'),
+])
+
+
+def measure(func, min_time=0.05, repeat=3):
+    # seconds per call, best of repeat runs of enough calls to take
+    # min_time
+    number = 1
+    while True:
+        elapsed = timeit.Timer(func).timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 2 >= min_time else 10
+    best = min([elapsed] + timeit.Timer(func).repeat(repeat - 1, number))
+    return best / number
+
+
+def lex(src):
+    return Lexer(src + "\n").run()
+
+
+def parse(tokens):
+    st = SyntaxTree(Context, tokens)
+    st.run()
+    return st
+
+
+def bench_lexer(src):
+    return measure(lambda: lex(src)) / len(src)
+
+
+def bench_parser(src):
+    tokens = lex(src)
+    statements = len([node for node in parse(list(tokens)).tree
+                      if not isinstance(node, nodes.NopNode)])
+    return measure(lambda: parse(list(tokens))) / statements
+
+
+def bench_nodes(statements):
+    context = Context()
+    context.bind_function('h', lambda x: x)
+    context.execute(SETUP)
+
+    def run():
+        for node in statements:
+            node.reduce(context)
+    return measure(run) / len(statements)
+
+
+def bench_expression(expression):
+    # parsed as the right side of an assignment, which isn't run
+    return bench_nodes([parse(lex('x = ' + expression)).tree[0].right])
+
+
+def bench_statement(snippet):
+    tree = parse(lex(snippet)).tree
+    return bench_nodes([node for node in tree
+                        if not isinstance(node, nodes.NopNode)] or tree[:1])
+
+
+def run_all(only=None):
+    src = SCRIPT * 20
+    results = OrderedDict()
+    benches = [('lexer', lambda: bench_lexer(src)),
+               ('parser', lambda: bench_parser(src))]
+    benches += [('node.' + name, lambda src=src: bench_expression(src))
+                for name, src in EXPRESSION_CASES.iteritems()]
+    benches += [('node.' + name, lambda build=build: bench_nodes([build()]))
+                for name, build in BUILT_CASES.iteritems()]
+    benches += [('node.' + name, lambda src=src: bench_statement(src))
+                for name, src in STATEMENT_CASES.iteritems()]
+    for name, bench in benches:
+        if only is not None and only not in name:
+            continue
+        results[name] = bench()
+        print "%-28s %10.3f us" % (name, results[name] * 1000000)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, seconds in results.iteritems():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = '  faster'
+        print "%-28s %+7.1f%%%s" % (name, (ratio - 1) * 100, flag)
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save', help="write the results to this file")
+    parser.add_argument('--compare', help="baseline file to compare with")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown flagged as a regression")
+    parser.add_argument('--only', help="run benchmarks with this in the name")
+    args = parser.parse_args(argv)
+    results = run_all(args.only)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print "%d regressions: %s" % (len(regressions),
+                                          ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,66 @@
+from decimal import Decimal
+from saulscript import HostBindings
+from saulscript.runtime.pool import WorkerPool
+import random
+import sys
+import threading
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+# usage: bench_pool.py [processes] [requests] [distinct scripts] [clients]
+processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+num_scripts = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+num_clients = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+template = '''
+// script %d
+table = {
+    a: 1, b: 2, c: 3, d: 4, e: 5, f: 6
+}
+score = function(x, y) {
+    return x * %d + y
+}
+total = 0
+for key in table
+    total = total + score(table[key], base)
+end for
+i = 0
+while i < 20
+    i = i + 1
+    total = total + lookup(i)
+end while
+'''
+scripts = [template % (i, i) for i in range(num_scripts)]
+
+lib = HostBindings()
+lib.bind_function('lookup', lambda i: i * 2)
+lib.freeze()
+pool = WorkerPool(processes=processes, bindings=lib)
+
+
+def client(count):
+    rng = random.Random()
+    for i in range(count):
+        # a few popular scripts and a long tail, like a real mod pack
+        src = scripts[min(int(rng.expovariate(0.1)), num_scripts - 1)]
+        pool.execute(src, values={'base': Decimal(1)}, op_limit=100000)
+
+threads = [threading.Thread(target=client,
+                            args=(num_requests // num_clients,))
+           for i in range(num_clients)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+stats = pool.stats()
+pool.close()
+latency = stats['latency']
+print "%d workers, %d clients: %d done, %d failed" % (
+    processes, num_clients, stats['completed'], stats['failed'])
+print "throughput %.1f/s, p50 %.2fms, p99 %.2fms" % (
+    stats['throughput'], latency['p50'] * 1000, latency['p99'] * 1000)
+print "compile cache hits %d, rerouted %d, stolen %d" % (
+    stats['cache_hits'], stats['rerouted'], stats['stolen'])
@@ -0,0 +1,121 @@
+from saulscript import Context
+from saulscript.clock import clock
+from saulscript.generator import generate
+from saulscript.lexer import Lexer
+from saulscript.syntax_tree import SyntaxTree
+import argparse
+import gc
+import logging
+import sys
+import types
+
+logging.basicConfig(level=logging.ERROR)
+
+# Lex, parse and run generated scripts of growing size and tabulate the
+# cost per unit, a column that grows along with the size means
+# something is worse than linear.
+#
+# usage: bench_scaling.py [--vary statements] [--values 50,100,200,400]
+#                         [--depth 2] [--functions 3] [--literal-size 5]
+#                         [--loop-count 3]
+
+SKIP_TYPES = (type, types.ModuleType, types.FunctionType,
+              types.BuiltinFunctionType)
+
+
+def deep_sizeof(root):
+    # bytes held by root and everything reachable from it
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SKIP_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def timed(func, *args):
+    started = clock()
+    result = func(*args)
+    return result, clock() - started
+
+
+def lex(src):
+    return Lexer(src + "\n").run()
+
+
+def parse(tokens):
+    st = SyntaxTree(Context, tokens)
+    st.run()
+    return st
+
+
+def run(st):
+    context = Context()
+    st.execute(context)
+    return context
+
+
+def measure(settings):
+    src = generate(**settings)
+    tokens, lex_time = timed(lex, src)
+    num_tokens = len(tokens)
+    st, parse_time = timed(parse, tokens)
+    context, run_time = timed(run, st)
+    return {
+        'lines': src.count('\n'),
+        'tokens': num_tokens,
+        'lex': lex_time,
+        'parse': parse_time,
+        'run': run_time,
+        'ops': context.operations_counted,
+        'ast': deep_sizeof(st.tree),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vary', default='statements',
+                        choices=['statements', 'depth', 'functions',
+                                 'literal_size', 'loop_count'])
+    parser.add_argument('--values', default='50,100,200,400,800')
+    parser.add_argument('--statements', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--functions', type=int, default=3)
+    parser.add_argument('--literal-size', type=int, default=5)
+    parser.add_argument('--loop-count', type=int, default=3)
+    args = parser.parse_args(argv)
+    settings = {
+        'statements': args.statements,
+        'depth': args.depth,
+        'functions': args.functions,
+        'literal_size': args.literal_size,
+        'loop_count': args.loop_count,
+    }
+    print "%8s %7s %7s %10s %11s %10s %9s %10s %9s" % (
+        args.vary, 'lines', 'tokens', 'lex ms', 'parse ms', 'run ms',
+        'ops', 'AST KB', 'B/token')
+    print "%8s %7s %7s %10s %11s %10s %9s" % (
+        '', '', '', 'us/token', 'us/token', 'us/op', '')
+    for value in [int(v) for v in args.values.split(',')]:
+        settings[args.vary] = value
+        result = measure(settings)
+        tokens = max(result['tokens'], 1)
+        ops = max(result['ops'], 1)
+        print "%8d %7d %7d %10.2f %11.2f %10.2f %9d %10.1f %9.1f" % (
+            value, result['lines'], result['tokens'], result['lex'] * 1000,
+            result['parse'] * 1000, result['run'] * 1000, result['ops'],
+            result['ast'] / 1024.0, float(result['ast']) / tokens)
+        print "%8s %7s %7s %10.2f %11.2f %10.2f" % (
+            '', '', '', result['lex'] * 1000000 / tokens,
+            result['parse'] * 1000000 / tokens,
+            result['run'] * 1000000 / ops)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
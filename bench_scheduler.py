@@ -0,0 +1,45 @@
+from saulscript import Context
+from saulscript.runtime.scheduler import Scheduler
+from saulscript.runtime.stats import summarize
+import sys
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+# usage: bench_scheduler.py [scripts] [ticks] [ops per tick] [frame ms]
+num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+num_ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+ops_per_tick = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+frame_ms = float(sys.argv[4]) if len(sys.argv) > 4 else 50.0
+
+src = '''
+hp = 100
+steps = 0
+while steps < 50
+    steps = steps + 1
+    target = nearest(steps)
+    if target > 3
+        hp = hp - 1
+    end if
+end while
+'''
+
+base = Context()
+base.bind_function('nearest', lambda n: n % 7)
+template = base.snapshot()
+tree = base.compile(src)
+
+scheduler = Scheduler(ops_per_tick=ops_per_tick, frame_time=frame_ms / 1000)
+for i in range(num_scripts):
+    scheduler.add(i, template.fork(), tree)
+
+frame_times = []
+for tick in range(num_ticks):
+    report = scheduler.tick()
+    frame_times.append(report.frame_time)
+    print report
+
+frames = summarize(frame_times)
+print "%d scripts, %d ticks: frame p50 %.2fms p99 %.2fms max %.2fms" % (
+    num_scripts, num_ticks, frames['p50'] * 1000, frames['p99'] * 1000,
+    frames['max'] * 1000)
@@ -1,3 +1,3 @@
 import exceptions
 import runtime
-from runtime import Context
+from runtime import Context, HostBindings, CostModel, Profiler, Sampler
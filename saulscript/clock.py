@@ -0,0 +1,56 @@
+import ctypes
+import ctypes.util
+import os
+import sys
+import time
+
+# clock() returns seconds from a monotonic clock, for measuring
+# intervals only. Python 2 has no time.monotonic, so on Linux and BSD
+# clock_gettime(CLOCK_MONOTONIC) is called through ctypes. Where that
+# isn't available it falls back to time.time(), a wall clock that can
+# jump when the system time is set, see MONOTONIC.
+
+if 'bsd' in sys.platform:
+    CLOCK_MONOTONIC = 4
+elif sys.platform == 'darwin':
+    CLOCK_MONOTONIC = 6
+else:
+    CLOCK_MONOTONIC = 1
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _clock_gettime():
+    try:
+        library = ctypes.CDLL(ctypes.util.find_library('rt') or
+                              ctypes.util.find_library('c'),
+                              use_errno=True)
+        clock_gettime = library.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def monotonic():
+        # a timespec per call, threads read the clock concurrently
+        spec = _timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    try:
+        monotonic()
+    except OSError:
+        return None
+    return monotonic
+
+
+try:
+    from time import monotonic as clock
+    MONOTONIC = True
+except ImportError:
+    clock = _clock_gettime()
+    MONOTONIC = clock is not None
+    if clock is None:
+        clock = time.time
@@ -0,0 +1,199 @@
+from collections import MutableMapping, MutableSequence
+from decimal import Decimal
+import sys
+
+
+class CopyOnWrite(object):
+    # Storage is shared between a container and its snapshots until one
+    # of them writes, so taking a snapshot is O(1). Containers nested
+    # inside a shared container are snapshotted when the outer one is
+    # materialized, so writes through them can't leak either.
+
+    def __init__(self):
+        self._shared = False
+
+    def snapshot(self):
+        self._shared = True
+        copy = self.wrap(self._data)
+        copy._shared = True
+        return copy
+
+    def _materialize(self):
+        if self._shared:
+            self._data = self._copy_data()
+            self._shared = False
+
+    @classmethod
+    def wrap(cls, data):
+        # wrap data without copying it, the caller gives up ownership
+        container = cls.__new__(cls)
+        container._data = data
+        container._shared = False
+        return container
+
+
+class CowDict(CopyOnWrite, MutableMapping):
+
+    def __init__(self, *args, **kwargs):
+        super(CowDict, self).__init__()
+        self._data = dict(*args, **kwargs)
+
+    def _copy_data(self):
+        return dict((k, snapshot(v)) for k, v in self._data.iteritems())
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if self._shared and isinstance(value, CopyOnWrite):
+            # handing out a shared child would let the caller write to it
+            self._materialize()
+            value = self._data[key]
+        return value
+
+    def __setitem__(self, key, value):
+        self._materialize()
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._materialize()
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def to_dict(self):
+        return dict(self.iteritems())
+
+    def __repr__(self):
+        return repr(self._data)
+
+
+class CowList(CopyOnWrite, MutableSequence):
+
+    def __init__(self, iterable=()):
+        super(CowList, self).__init__()
+        self._data = list(iterable)
+
+    def _copy_data(self):
+        return [snapshot(v) for v in self._data]
+
+    def __getitem__(self, index):
+        index = _index(index)
+        value = self._data[index]
+        if self._shared and isinstance(value, CopyOnWrite):
+            # handing out a shared child would let the caller write to it
+            self._materialize()
+            value = self._data[index]
+        return value
+
+    def __setitem__(self, index, value):
+        self._materialize()
+        self._data[_index(index)] = value
+
+    def __delitem__(self, index):
+        self._materialize()
+        del self._data[_index(index)]
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        # iteration hands out the items, see __getitem__
+        self._materialize()
+        return iter(self._data)
+
+    def insert(self, index, value):
+        self._materialize()
+        self._data.insert(_index(index), value)
+
+    def __add__(self, other):
+        if not isinstance(other, LIST_TYPES):
+            return NotImplemented
+        # both sides keep their nested containers, the result gets
+        # snapshots of them
+        return CowList.wrap([snapshot(v) for v in self._data] +
+                            [snapshot(v) for v in other])
+
+    def __radd__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        return CowList.wrap([snapshot(v) for v in other] +
+                            [snapshot(v) for v in self._data])
+
+    def __eq__(self, other):
+        if isinstance(other, CowList):
+            other = other._data
+        return self._data == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def to_list(self):
+        return list(self)
+
+    def __repr__(self):
+        return repr(self._data)
+
+
+def _index(index):
+    # script numbers are Decimals, which lists won't take as indexes
+    if isinstance(index, Decimal):
+        return int(index)
+    return index
+
+
+def snapshot(value):
+    if isinstance(value, CopyOnWrite):
+        return value.snapshot()
+    if isinstance(value, (dict, list)):
+        # a plain container put there by the host, copy it once
+        return wrap(value)
+    return value
+
+
+def wrap(value):
+    # copy-on-write copies of plain dicts and lists, nested ones too
+    if type(value) is dict:
+        return CowDict.wrap(dict((k, wrap(v)) for k, v in value.iteritems()))
+    if type(value) is list:
+        return CowList.wrap([wrap(v) for v in value])
+    return value
+
+
+def unwrap(value):
+    # plain dicts and lists for host code, which may check types or
+    # serialize them. They're copies, writes don't reach the script.
+    if isinstance(value, DICT_TYPES):
+        return dict((k, unwrap(v)) for k, v in value.iteritems())
+    if isinstance(value, LIST_TYPES):
+        return [unwrap(v) for v in value]
+    return value
+
+
+DICT_TYPES = (dict, CowDict)
+LIST_TYPES = (list, CowList)
+CONTAINER_TYPES = DICT_TYPES + LIST_TYPES
+
+
+# Rough sizes in bytes for memory accounting. Containers are charged
+# for their own slots only, the values in them were charged when they
+# were created.
+POINTER_SIZE = 8
+LIST_OVERHEAD = sys.getsizeof([])
+DICT_OVERHEAD = sys.getsizeof({})
+DICT_ENTRY_SIZE = 3 * POINTER_SIZE
+
+
+def sizeof(value):
+    if isinstance(value, basestring):
+        return sys.getsizeof(value)
+    if isinstance(value, LIST_TYPES):
+        return LIST_OVERHEAD + POINTER_SIZE * len(value)
+    if isinstance(value, DICT_TYPES):
+        return DICT_OVERHEAD + DICT_ENTRY_SIZE * len(value)
+    return sys.getsizeof(value)
@@ -7,7 +7,7 @@ class SaulException(Exception):
     def __init__(self, line_num, *args, **kwargs):
         self.line_num = line_num
         super(SaulException, self).__init__(self, *args, **kwargs)
-        self.message = args[0]
+        self.message = args[0] if args else None
 
 
 class ParseError(SaulException):
@@ -47,9 +47,24 @@ class OperationLimitReached(Exception):
 class TimeLimitReached(Exception):
     
     def __init__(self, total_seconds):
+        self.total_seconds = total_seconds
         super(Exception, self).__init__(self, "Script's time limit was reached after %.2f seconds." % total_seconds)
 
 
+class MemoryLimitReached(Exception):
+
+    def __init__(self, bytes_used):
+        self.bytes_used = bytes_used
+        super(Exception, self).__init__(self, "Script's memory limit was reached after allocating %d bytes." % bytes_used)
+
+
+class SuspendExecution(Exception):
+
+    def __init__(self, awaitable):
+        self.awaitable = awaitable
+        super(SuspendExecution, self).__init__("Waiting on a host call")
+
+
 class UnexpectedCharacter(SaulException):
 
     def __init__(self, line_num, char, *args, **kwargs):
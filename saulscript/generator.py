@@ -0,0 +1,124 @@
+import random
+
+# Valid SaulScript of a controlled shape, for scaling and stress tests.
+# Everything generated runs without errors: numbers stay small, loops
+# always end and functions return from their top level.
+
+
+class ScriptGenerator(object):
+
+    def __init__(self, statements=50, depth=2, functions=3, literal_size=5,
+                 loop_count=3, seed=0):
+        # statements at the top level, blocks nested up to depth, loops
+        # run loop_count times, literals have literal_size elements
+        self.statements = statements
+        self.depth = depth
+        self.functions = functions
+        self.literal_size = literal_size
+        self.loop_count = loop_count
+        self.random = random.Random(seed)
+        self.counter = 0
+
+    def name(self, prefix):
+        self.counter += 1
+        return '%s%d' % (prefix, self.counter)
+
+    def operand(self, names):
+        if names and self.random.random() < 0.7:
+            return self.random.choice(names)
+        return str(self.random.randint(0, 9))
+
+    def expression(self, names):
+        expr = self.operand(names)
+        for i in range(self.random.randint(0, 2)):
+            expr = '%s %s %s' % (expr, self.random.choice('+-'),
+                                 self.operand(names))
+        return expr
+
+    def condition(self, names):
+        return '%s %s %s' % (self.operand(names),
+                             self.random.choice(['<', '>', '==']),
+                             self.operand(names))
+
+    def block(self, names, depth, indent, lines):
+        # one statement, possibly a block holding more of them
+        pad = '    ' * indent
+        kind = self.random.random()
+        if depth > 0 and kind < 0.15:
+            lines.append('%sif %s' % (pad, self.condition(names)))
+            for i in range(self.random.randint(1, 3)):
+                self.block(names, depth - 1, indent + 1, lines)
+            lines.append('%send if' % pad)
+        elif depth > 0 and kind < 0.25:
+            counter = self.name('c')
+            lines.append('%s%s = 0' % (pad, counter))
+            lines.append('%swhile %s < %d' % (pad, counter, self.loop_count))
+            for i in range(self.random.randint(1, 3)):
+                self.block(names, depth - 1, indent + 1, lines)
+            lines.append('%s    %s = %s + 1' % (pad, counter, counter))
+            lines.append('%send while' % pad)
+        elif depth > 0 and kind < 0.32 and self.lists:
+            item = self.name('it')
+            lines.append('%sfor %s in %s' % (pad, item,
+                                             self.random.choice(self.lists)))
+            self.block(names + [item], depth - 1, indent + 1, lines)
+            lines.append('%send for' % pad)
+        elif kind < 0.45 and self.function_names:
+            target = self.random.choice(names)
+            lines.append('%s%s = %s(%s, %s)' % (
+                pad, target, self.random.choice(self.function_names),
+                self.operand(names), self.operand(names)))
+        elif kind < 0.55 and self.tables:
+            table, keys = self.random.choice(self.tables)
+            key = self.random.choice(keys)
+            if self.random.random() < 0.5:
+                value = "%s['%s']" % (table, key)
+            else:
+                value = '%s.%s' % (table, key)
+            lines.append('%s%s = %s' % (pad, self.random.choice(names),
+                                        value))
+        else:
+            lines.append('%s%s = %s' % (pad, self.random.choice(names),
+                                        self.expression(names)))
+
+    def function(self, name, lines):
+        lines.append('%s = function(a, b) {' % name)
+        lines.append('    r = a + b')
+        names = ['a', 'b', 'r']
+        for i in range(self.random.randint(1, 4)):
+            # no loops in function bodies, a return inside one only
+            # leaves the loop
+            self.block(names, 0, 1, lines)
+        lines.append('    return r')
+        lines.append('}')
+
+    def generate(self):
+        lines = []
+        self.tables = []
+        self.lists = []
+        self.function_names = []
+        for i in range(max(1, self.functions // 2)):
+            table = self.name('table')
+            keys = ['k%d' % k for k in range(self.literal_size)]
+            lines.append('%s = {%s}' % (table, ', '.join(
+                '%s: %d' % (key, self.random.randint(0, 9)) for key in keys)))
+            self.tables.append((table, keys))
+            items = self.name('list')
+            lines.append('%s = [%s]' % (items, ', '.join(
+                str(self.random.randint(0, 9))
+                for k in range(self.literal_size))))
+            self.lists.append(items)
+        for i in range(self.functions):
+            name = self.name('fn')
+            self.function(name, lines)
+            self.function_names.append(name)
+        names = ['v%d' % i for i in range(5)]
+        for name in names:
+            lines.append('%s = %d' % (name, self.random.randint(0, 9)))
+        for i in range(self.statements):
+            self.block(names, self.depth, 0, lines)
+        return '\n'.join(lines) + '\n'
+
+
+def generate(**kwargs):
+    return ScriptGenerator(**kwargs).generate()
@@ -1 +1,8 @@
 from context import Context
+from bindings import HostBindings
+from cost import CostModel
+from profiler import Profiler
+from sampler import Sampler
+from metrics import MetricsRegistry, export_prometheus
+from bundle import Bundle, BundleWriter, write_bundle
+from loader import load_directory
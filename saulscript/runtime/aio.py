@@ -0,0 +1,86 @@
+import logging
+from .. import exceptions
+from .execution import Execution
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+# Runs a resumable Execution as a task on an asyncio (or trollius)
+# event loop. The script yields to the loop every slice, and when a
+# host function returns a coroutine or future the script is suspended
+# until it's done, so one process can run many I/O-bound scripts.
+
+
+def is_awaitable(value):
+    if asyncio is not None and asyncio.iscoroutine(value):
+        return True
+    return hasattr(value, 'add_done_callback') and hasattr(value, 'result')
+
+
+class AsyncExecution(object):
+
+    def __init__(self, execution, loop):
+        self.execution = execution
+        self.loop = loop
+        if hasattr(loop, 'create_future'):
+            self.future = loop.create_future()
+        else:
+            self.future = asyncio.Future(loop=loop)
+        execution.is_awaitable = is_awaitable
+        self.suspensions = 0
+
+    def start(self):
+        self.loop.call_soon(self.step)
+        return self.future
+
+    def step(self):
+        if self.future.done():
+            # cancelled while waiting for the loop
+            return
+        try:
+            result = self.execution.resume()
+        except exceptions.SuspendExecution as e:
+            self.suspensions += 1
+            self.wait(e.awaitable)
+            return
+        except Exception as e:
+            logging.debug("Async script failed: %s", e)
+            self.future.set_exception(e)
+            return
+        if result is True:
+            self.future.set_result(self.execution.context)
+        else:
+            self.loop.call_soon(self.step)
+
+    def wait(self, awaitable):
+        if asyncio is not None and asyncio.iscoroutine(awaitable):
+            awaitable = asyncio.ensure_future(awaitable, loop=self.loop)
+        # plain concurrent futures call back from their own thread
+        awaitable.add_done_callback(
+            lambda done: self.loop.call_soon_threadsafe(self.wake, done))
+
+    def wake(self, done):
+        try:
+            self.execution.resolve(done.result())
+        except Exception as e:
+            self.execution.resolve(e, failed=True)
+        self.step()
+
+
+def execute_async(context, syntax_tree, loop=None, slice_ops=1000,
+                  op_limit=-1, time_limit=-1):
+    if loop is None:
+        if asyncio is None:
+            raise Exception("execute_async needs asyncio or trollius")
+        loop = asyncio.get_event_loop()
+    context.reset_instrumentation()
+    context.set_op_limit(op_limit)
+    context.set_time_limit(time_limit)
+    execution = Execution(context, syntax_tree.tree, slice_ops)
+    return AsyncExecution(execution, loop).start()
+
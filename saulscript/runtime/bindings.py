@@ -0,0 +1,82 @@
+from decimal import Decimal
+from .. import containers
+from .cache import shared_cached_function
+
+
+class Bindable(object):
+    # bind_function/bind_value bookkeeping shared by contexts and host
+    # bindings. pure_functions, cached_functions and function_costs may
+    # be shared with other contexts, so they're replaced rather than
+    # mutated.
+
+    def bind_function(self, name, func, pure=False, cache=False, ttl=None,
+                      per_tick=False, cache_size=128, cost=None):
+        # pure=True or cache=True memoize the function forever, ttl
+        # expires entries after that many seconds and per_tick clears
+        # them on tick(). pure also lets memoized script functions call it.
+        # cost is charged in operations on every call, either a number
+        # or a function of the call's arguments returning one
+        if not callable(func):
+            raise Exception("Must be callable")
+        cached_functions = dict(self.cached_functions)
+        cached_functions.pop(name, None)
+        if pure or cache or ttl is not None or per_tick:
+            func = shared_cached_function(func, pure=pure, ttl=ttl,
+                                          per_tick=per_tick, size=cache_size)
+            cached_functions[name] = func
+        self.cached_functions = cached_functions
+        if cost is not None:
+            function_costs = dict(self.function_costs)
+            function_costs[func] = cost
+            self.function_costs = function_costs
+        self.bound_functions = self.bound_functions | frozenset([name])
+        self[name] = func
+        if pure:
+            self.pure_functions = self.pure_functions | frozenset([name])
+        else:
+            self.pure_functions = self.pure_functions - frozenset([name])
+
+    def bind_value(self, name, val):
+        if type(val) not in (str, Decimal) + containers.CONTAINER_TYPES:
+            raise Exception("Must be string, decimal, dict, or list")
+        # copy-on-write, so forks of this context get their own copy
+        self[name] = containers.wrap(val)
+
+    def tick(self, number=None):
+        for func in self.cached_functions.itervalues():
+            if func.per_tick:
+                func.set_tick(number)
+
+    def cache_stats(self):
+        return dict((name, func.stats())
+                    for name, func in self.cached_functions.iteritems())
+
+
+class HostBindings(Bindable, dict):
+    # A standard library of host functions and values, bound once and
+    # shared by every Context created with Context(bindings=...).
+
+    def __init__(self):
+        self.pure_functions = frozenset()
+        self.bound_functions = frozenset()
+        self.cached_functions = {}
+        self.function_costs = {}
+        self.frozen = False
+        super(HostBindings, self).__init__()
+
+    def freeze(self):
+        self.frozen = True
+        return self
+
+    def __setitem__(self, key, value):
+        if self.frozen:
+            raise Exception("Host bindings are frozen")
+        super(HostBindings, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self.frozen:
+            raise Exception("Host bindings are frozen")
+        super(HostBindings, self).__delitem__(key)
+
+    def __repr__(self):
+        return '<host bindings: %d names>' % len(self)
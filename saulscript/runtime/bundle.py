@@ -0,0 +1,148 @@
+import logging
+import mmap
+import struct
+import zlib
+from .. import exceptions
+from ..syntax_tree import SyntaxTree
+from .context import Context
+from .sandbox import source_hash
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Many precompiled scripts in one file. A bundle is MAGIC, the offset of
+# the index, one zlib(pickle(tree)) entry per script and finally the
+# index, zlib(pickle({script_id: (source_hash, offset, length)})).
+# Opening a bundle maps the file and reads the index only, a script's
+# syntax tree is unpickled the first time it runs.
+
+MAGIC = 'SAULB\x01'
+_HEADER = struct.Struct('<Q')
+
+
+def _dumps(value):
+    return zlib.compress(pickle.dumps(value, 2))
+
+
+def _loads(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+class BundleWriter(object):
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + _HEADER.pack(0))
+        self.index = {}
+
+    def add_tree(self, script_id, digest, tree):
+        # tree is a syntax tree's root branch
+        if script_id in self.index:
+            raise Exception("Script %s is already in the bundle" % script_id)
+        data = _dumps(tree)
+        self.index[script_id] = (digest, self.file.tell(), len(data))
+        self.file.write(data)
+
+    def add(self, script_id, src, context=None):
+        context = context or Context()
+        self.add_tree(script_id, source_hash(src), context.compile(src).tree)
+
+    def close(self):
+        offset = self.file.tell()
+        self.file.write(_dumps(self.index))
+        self.file.seek(len(MAGIC))
+        self.file.write(_HEADER.pack(offset))
+        self.file.close()
+        logging.debug("Bundled %d scripts", len(self.index))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_bundle(path, sources, context=None):
+    # sources maps script ids to source text
+    with BundleWriter(path) as writer:
+        for script_id, src in sources.iteritems():
+            writer.add(script_id, src, context)
+
+
+class BundledTree(SyntaxTree):
+    # a syntax tree whose nodes are loaded from the bundle on first use
+
+    def __init__(self, bundle, script_id):
+        self.bundle = bundle
+        self.script_id = script_id
+        self.loaded = None
+
+    @property
+    def tree(self):
+        if self.loaded is None:
+            self.loaded = self.bundle.load_tree(self.script_id)
+        return self.loaded
+
+
+class Bundle(object):
+
+    def __init__(self, path, interner=None):
+        # nodes of the loaded scripts go through interner if one is given
+        self.interner = interner
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise exceptions.SaulRuntimeError(0, "Not a script bundle")
+        offset, = _HEADER.unpack_from(self.map, len(MAGIC))
+        self.index = _loads(self.map[offset:])
+        self.by_hash = dict((entry[0], script_id)
+                            for script_id, entry in self.index.iteritems())
+        self.scripts = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, script_id):
+        return script_id in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def source_hash(self, script_id):
+        return self.index[script_id][0]
+
+    def is_current(self, script_id, src):
+        # False when the script changed since the bundle was written
+        return script_id in self.index and \
+            self.index[script_id][0] == source_hash(src)
+
+    def find(self, src):
+        # the id of a bundled script with this source, or None
+        return self.by_hash.get(source_hash(src))
+
+    def load_tree(self, script_id):
+        digest, offset, length = self.index[script_id]
+        tree = _loads(self.map[offset:offset + length])
+        logging.debug("Loaded %s from the bundle", script_id)
+        if self.interner is not None:
+            tree = self.interner.intern(tree)
+        return tree
+
+    def __getitem__(self, script_id):
+        script = self.scripts.get(script_id)
+        if script is None:
+            if script_id not in self.index:
+                raise KeyError(script_id)
+            script = self.scripts[script_id] = BundledTree(self, script_id)
+        return script
+
+    def get(self, script_id, default=None):
+        if script_id not in self.index:
+            return default
+        return self[script_id]
+
+    def close(self):
+        self.map.close()
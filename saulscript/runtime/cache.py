@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from decimal import Decimal
+import threading
+import logging
+import weakref
+from .. import containers
+from ..clock import clock
+
+_missing = object()
+
+
+def call_key(args):
+    # Decimal('3') == Decimal('3.0') but they print differently, so
+    # they're different calls
+    return tuple((Decimal, str(arg)) if type(arg) is Decimal
+                 else (type(arg), arg) for arg in args)
+
+
+class LRUCache(object):
+
+    def __init__(self, size=128):
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # OrderedDict updates aren't atomic, the cache of a memoized
+        # script function is shared by every thread running the script
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            value = self.data.pop(key, _missing)
+            if value is _missing:
+                self.misses += 1
+                return default
+            # re-insert so the key becomes the most recently used
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.data),
+            'max_size': self.size,
+        }
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getstate__(self):
+        # locks can't be pickled, memoized functions end up in
+        # checkpoints along with their caches
+        with self.lock:
+            state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class CachedFunction(object):
+
+    def __init__(self, func, pure=False, ttl=None, per_tick=False, size=128):
+        self.func = func
+        self.pure = pure
+        self.ttl = ttl
+        self.per_tick = per_tick
+        self.cache = LRUCache(size)
+        self.tick = None
+        self.expired = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        key = call_key(args)
+        try:
+            hash(key)
+        except TypeError:
+            # dicts and lists can't be keys, always call through
+            self.uncacheable += 1
+            return self.func(*args)
+        with self.lock:
+            entry = self.cache.get(key, _missing)
+            if entry is not _missing:
+                value, expires = entry
+                if expires is None or clock() < expires:
+                    return containers.snapshot(value)
+                self.expired += 1
+        # the cache is shared by every context, so containers are kept
+        # copy-on-write and every caller gets a copy of its own
+        value = containers.wrap(self.func(*args))
+        expires = clock() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.cache.put(key, (value, expires))
+        return containers.snapshot(value)
+
+    def set_tick(self, tick):
+        # contexts sharing this function may all report the same tick,
+        # only the first report of a new tick clears the cache
+        with self.lock:
+            if tick is not None and tick == self.tick:
+                return
+            self.tick = tick
+            self.cache.clear()
+            self.invalidations += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            stats = self.cache.stats()
+        # an expired entry was found by the LRU but still cost a call
+        stats['hits'] -= self.expired
+        stats['misses'] += self.expired
+        stats.update({
+            'expired': self.expired,
+            'invalidations': self.invalidations,
+            'uncacheable': self.uncacheable,
+        })
+        return stats
+
+    def __repr__(self):
+        return '<cached %r>' % self.func
+
+
+# Weak values: an entry lives as long as some context has the cached
+# function bound. The cached function holds func, so func's id can't
+# be reused while its entry exists. Weak keys on func wouldn't work,
+# the value refers to the key and would keep it alive forever.
+_shared_functions = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+
+def shared_cached_function(func, pure=False, ttl=None, per_tick=False,
+                           size=128):
+    # binding the same function with the same policy in many contexts
+    # hands out one cache, so all contexts benefit from each other's calls
+    key = (id(func), pure, ttl, per_tick, size)
+    with _shared_lock:
+        cached = _shared_functions.get(key)
+        if cached is None:
+            logging.debug("Creating shared cache for %r", func)
+            cached = CachedFunction(func, pure=pure, ttl=ttl,
+                                    per_tick=per_tick, size=size)
+            _shared_functions[key] = cached
+        return cached
+
+
+def clear_shared_caches():
+    with _shared_lock:
+        _shared_functions.clear()
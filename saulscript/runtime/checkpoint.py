@@ -0,0 +1,116 @@
+import datetime
+import logging
+import zlib
+from .. import exceptions
+from .bindings import HostBindings
+from .execution import Execution
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+# A checkpoint is MAGIC + zlib(pickle(state)). Host functions and
+# host bindings aren't stored, they're written as references by name
+# and looked up in the context the checkpoint is restored into, so
+# prepare that context with the same bind_function calls or bindings.
+
+MAGIC = 'SAUL\x01'
+
+
+def _context_chain(context):
+    chain = []
+    while context is not None:
+        chain.append(context)
+        context = context.parent
+    return chain
+
+
+def _host_names(context):
+    # names the host bound functions under, scripts may hold them
+    # under other names too
+    names = {}
+    for name in context.bound_functions:
+        if name in context:
+            names[id(context[name])] = name
+    return names
+
+
+def dumps(execution):
+    context = execution.context
+    roots = set(id(c) for c in _context_chain(context))
+    host_names = _host_names(context)
+
+    def persistent_id(obj):
+        if id(obj) in roots:
+            return ('context',)
+        if isinstance(obj, HostBindings):
+            return ('bindings',)
+        if id(obj) in host_names:
+            return ('host', host_names[id(obj)])
+        return None
+
+    state = {
+        'names': context.flatten(),
+        'tree': execution.tree,
+        'frames': execution.frames,
+        'slice_ops': execution.slice_ops,
+        'slices': execution.slices,
+        'elapsed': execution.elapsed.total_seconds(),
+        'operations_counted': context.operations_counted,
+        'operation_limit': context.operation_limit,
+        'time_limit': context.time_limit,
+        'memory_used': context.memory_used,
+        'memory_limit': context.memory_limit,
+        'host_time': context.host_time,
+        'return_value': context.return_value,
+    }
+    buf = StringIO()
+    pickler = pickle.Pickler(buf, 2)
+    pickler.persistent_id = persistent_id
+    pickler.dump(state)
+    data = MAGIC + zlib.compress(buf.getvalue())
+    logging.debug("Checkpoint is %d bytes", len(data))
+    return data
+
+
+def loads(data, context):
+    if not data.startswith(MAGIC):
+        raise exceptions.SaulRuntimeError(0, "Not a script checkpoint")
+
+    def persistent_load(pid):
+        if pid[0] == 'context':
+            return context
+        if pid[0] == 'bindings':
+            return context.bindings
+        try:
+            return context[pid[1]]
+        except KeyError:
+            raise exceptions.SaulRuntimeError(
+                0, "Checkpoint needs host function %s to be bound" % pid[1])
+
+    unpickler = pickle.Unpickler(
+        StringIO(zlib.decompress(data[len(MAGIC):])))
+    unpickler.persistent_load = persistent_load
+    state = unpickler.load()
+
+    for name, value in state['names'].iteritems():
+        context[name] = value
+    context.operations_counted = state['operations_counted']
+    context.operation_limit = state['operation_limit']
+    context.time_limit = state['time_limit']
+    context.memory_used = state.get('memory_used', 0)
+    context.memory_limit = state.get('memory_limit', -1)
+    context.host_time = state.get('host_time', 0.0)
+    context.return_value = state['return_value']
+    execution = Execution(context, state['tree'], state['slice_ops'])
+    execution.frames = state['frames']
+    execution.slices = state['slices']
+    execution.elapsed = datetime.timedelta(seconds=state['elapsed'])
+    return execution
+
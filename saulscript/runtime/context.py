@@ -1,26 +1,236 @@
-from decimal import Decimal
 import datetime
 import logging
+import weakref
 from .. import exceptions
-from ..syntax_tree import SyntaxTree
+from .. import containers
+from ..clock import clock
+from ..syntax_tree import SyntaxTree, nodes, purity
 from ..lexer import Lexer
+from .bindings import Bindable
+from .execution import Execution
+from . import aio
 
 
-class Context(dict):
+class ExecutionState(object):
+
+    # Counters and limits of one run of a script. A context and the
+    # local contexts of the functions it calls share one state, forks
+    # get their own, so contexts running the same syntax tree on
+    # different threads don't touch each other's counters.
+
+    def __init__(self, operation_limit=-1, time_limit=-1, memory_limit=-1):
+        self.operation_limit = operation_limit
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        # when set, time spent in host functions isn't held against
+        # the time limit
+        self.exempt_host_time = False
+        self.reset()
+
+    def reset(self):
+        logging.debug("Resetting start time")
+        self.start_time = datetime.datetime.now()
+        self.operations_counted = 0
+        self.memory_used = 0
+        self.host_time = 0.0
+        # function name -> [calls, seconds]
+        self.host_calls = {}
+
+    def check_limits(self):
+        if self.operations_counted > self.operation_limit and \
+                self.operation_limit > 0:
+            raise exceptions.OperationLimitReached()
+        if self.time_limit > 0:
+            seconds = (datetime.datetime.now() - self.start_time).total_seconds()
+            if self.exempt_host_time:
+                seconds -= self.host_time
+            if seconds > self.time_limit:
+                raise exceptions.TimeLimitReached(seconds)
+
+    def increment(self, num=1):
+        self.operations_counted += num
+        self.check_limits()
+
+    def call_host(self, name, func, args):
+        started = clock()
+        try:
+            return func(*args)
+        finally:
+            seconds = clock() - started
+            self.host_time += seconds
+            stats = self.host_calls.get(name)
+            if stats is None:
+                stats = self.host_calls[name] = [0, 0.0]
+            stats[0] += 1
+            stats[1] += seconds
+
+    def allocate(self, num_bytes):
+        # bytes of strings and containers the script created and may
+        # still hold. Values are given back when an assignment replaces
+        # the last reference to them, temporaries and function locals
+        # stay charged, so it's an upper bound on what's live
+        self.memory_used += num_bytes
+        if self.memory_used > self.memory_limit and self.memory_limit > 0:
+            raise exceptions.MemoryLimitReached(self.memory_used)
+
+    def release(self, num_bytes):
+        self.memory_used = max(self.memory_used - num_bytes, 0)
+
+
+def _state_property(name):
+    def getter(self):
+        return getattr(self.state, name)
+
+    def setter(self, value):
+        setattr(self.state, name, value)
+    return property(getter, setter)
+
+
+class Context(Bindable, dict):
 
     def __init__(self, *args, **kwargs):
+        self.bindings = kwargs.pop('bindings', None)
+        self.parent = None
+        self.isolated = False
+        self.execution = None
         self.return_value = None
+        self.state = ExecutionState()
         self.initialize_globals()
-        self.operations_counted = 0
-        self.operation_limit = -1
-        self.time_limit = -1
-        self.reset_instrumentation()
+        self.pure_functions = frozenset()
+        self.bound_functions = frozenset()
+        self.cached_functions = {}
+        self.function_costs = {}
+        self.cost_model = None
+        self.profiler = None
+        self.sampler = None
+        self.interner = None
+        if self.bindings is not None:
+            self.pure_functions = self.bindings.pure_functions
+            self.bound_functions = self.bindings.bound_functions
+            self.cached_functions = self.bindings.cached_functions
+            self.function_costs = self.bindings.function_costs
+        self.memo_size = 0
+        self.memo_hit_cost = 1
+        # FunctionNode -> LRUCache, see nodes.MemoizedFunction
+        self.memo_caches = weakref.WeakKeyDictionary()
         super(Context, self).__init__(self, *args, **kwargs)
 
+    operations_counted = _state_property('operations_counted')
+    operation_limit = _state_property('operation_limit')
+    time_limit = _state_property('time_limit')
+    start_time = _state_property('start_time')
+    memory_limit = _state_property('memory_limit')
+    memory_used = _state_property('memory_used')
+    host_time = _state_property('host_time')
+    exempt_host_time = _state_property('exempt_host_time')
+
+    # Names are looked up in this context, then its parent chain (function
+    # locals -> script globals -> forked bases) and finally the shared
+    # host bindings. Writes always land in this context. len(), iteration
+    # and repr only cover this context's own names, see flatten().
+
+    def __missing__(self, key):
+        if self.parent is None:
+            if self.bindings is None:
+                raise KeyError(key)
+            value = self.bindings[key]
+            if isinstance(value, containers.CONTAINER_TYPES):
+                # host bindings are shared by every context, writes go
+                # to this context's own copy
+                value = containers.snapshot(value)
+                self[key] = value
+            return value
+        value = self.parent[key]
+        if self.isolated:
+            if isinstance(value, containers.CONTAINER_TYPES):
+                # take a private copy so writes through it stay in this fork
+                value = containers.snapshot(value)
+                self[key] = value
+            elif isinstance(value, nodes.ScriptFunction):
+                # script functions see this fork's globals, not the base's
+                value = value.bind(self)
+                self[key] = value
+        return value
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        if self.parent is not None:
+            return key in self.parent
+        return self.bindings is not None and key in self.bindings
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def flatten(self):
+        names = set()
+        context = self
+        while context is not None:
+            names.update(dict.iterkeys(context))
+            context = context.parent
+        return dict((name, self[name]) for name in names)
+
+    def inherit_settings(self, other):
+        self.bindings = other.bindings
+        self.operation_limit = other.operation_limit
+        self.time_limit = other.time_limit
+        self.memory_limit = other.memory_limit
+        self.exempt_host_time = other.exempt_host_time
+        # shared with the other context, bind_function replaces
+        # rather than mutates them
+        self.pure_functions = other.pure_functions
+        self.bound_functions = other.bound_functions
+        self.cached_functions = other.cached_functions
+        self.function_costs = other.function_costs
+        self.cost_model = other.cost_model
+        self.profiler = other.profiler
+        self.sampler = other.sampler
+        self.interner = other.interner
+        self.memo_size = other.memo_size
+        self.memo_hit_cost = other.memo_hit_cost
+
+    def snapshot(self):
+        # O(number of names) once, so prepare a base context, snapshot it
+        # and fork the snapshot for every script instance
+        frozen = FrozenContext()
+        frozen.fork_class = self.fork_class
+        frozen.inherit_settings(self)
+        for name, value in self.flatten().iteritems():
+            dict.__setitem__(frozen, name, containers.snapshot(value))
+        return frozen
+
+    def fork(self):
+        # O(1): the child starts empty and reads through to this context,
+        # copy-on-write containers are copied the first time they're read
+        child = self.fork_class()
+        child.inherit_settings(self)
+        child.parent = self
+        child.isolated = True
+        if child.sampler is not None:
+            child.sampler.attach(child.state)
+        return child
+
+    def local_context(self):
+        # a layer for function locals, thrown away when the call returns
+        child = self.fork_class()
+        child.inherit_settings(self)
+        if self.execution is not None:
+            # see Execution.call_host
+            self.execution.function_calls += 1
+        child.execution = self.execution
+        child.state = self.state
+        child.parent = self
+        return child
+
+    @property
+    def fork_class(self):
+        return self.__class__
+
     def reset_instrumentation(self):
-        logging.debug("Resetting start time")
-        self.start_time = datetime.datetime.now()
-        self.operations_counted = 0
+        self.state.reset()
 
     def set_op_limit(self, num):
         self.operation_limit = num
@@ -28,19 +238,73 @@ class Context(dict):
     def set_time_limit(self, seconds):
         self.time_limit = seconds
 
+    def set_host_time_exempt(self, exempt=True):
+        # exempt time spent in bound functions from the time limit
+        self.exempt_host_time = exempt
+
+    def host_stats(self):
+        # calls and seconds per host function, by the name it was called as
+        return dict((name, {'calls': calls, 'seconds': seconds})
+                    for name, (calls, seconds)
+                    in self.state.host_calls.iteritems())
+
+    def call_host(self, name, func, args):
+        if self.execution is not None:
+            # resumable script, the call may suspend it
+            return self.execution.call_host(name, func, args)
+        return self.state.call_host(name, func, args)
+
+    def set_profiler(self, profiler):
+        # a runtime.profiler.Profiler, or None to stop profiling
+        self.profiler = profiler
+
+    def set_sampler(self, sampler):
+        # a runtime.sampler.Sampler, or None to stop sampling
+        if self.sampler is not None:
+            self.sampler.detach(self.state)
+        self.sampler = sampler
+        if sampler is not None:
+            sampler.attach(self.state)
+
+    def set_interner(self, interner):
+        # a syntax_tree.Interner shared by the contexts compiling the
+        # scripts, or None to stop sharing nodes
+        self.interner = interner
+
+    def set_cost_model(self, cost_model):
+        # None charges one operation per node, see runtime.cost
+        self.cost_model = cost_model
+
+    def set_memory_limit(self, num_bytes):
+        self.memory_limit = num_bytes
+
+    def allocate(self, value):
+        self.state.allocate(containers.sizeof(value))
+
+    def release(self, value):
+        self.state.release(containers.sizeof(value))
+
+    def set_memoization(self, size, hit_cost=1):
+        # size 0 turns memoization of pure script functions off
+        self.memo_size = size
+        self.memo_hit_cost = hit_cost
+
+    def is_pure(self, function_node):
+        return purity.is_pure(function_node, self)
+
+    def memo_stats(self):
+        totals = {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0}
+        for cache in self.memo_caches.values():
+            for key, value in cache.stats().iteritems():
+                if key in totals:
+                    totals[key] += value
+        return totals
+
     def check_limits(self):
-        if self.operations_counted > self.operation_limit and \
-                self.operation_limit > 0:
-            raise exceptions.OperationLimitReached()
-        now = datetime.datetime.now()
-        delta = now - self.start_time
-        if delta.total_seconds() > self.time_limit and \
-                self.time_limit > 0:
-            raise exceptions.TimeLimitReached(delta.total_seconds())
+        self.state.check_limits()
 
     def increment_operations(self, num=1):
-        self.operations_counted = self.operations_counted + num
-        self.check_limits()
+        self.state.increment(num)
 
     def initialize_globals(self):
         pass
@@ -48,25 +312,50 @@ class Context(dict):
     def set_return_value(self, node):
         self.return_value = node
 
-    def bind_function(self, name, func):
-        if not callable(func):
-            raise Exception("Must be callable")
-        self[name] = func
-
-    def bind_value(self, name, val):
-        if type(val) not in (str, Decimal, dict, list):
-            raise Exception("Must be string, decimal, dict, or list")
-        self[name] = val
-
-    def execute(self, src, op_limit=-1, time_limit=-1):
-        self.reset_instrumentation()
+    def compile(self, src):
         new_lexer = Lexer(src + "\n")
         tokens = new_lexer.run()
         logging.debug("%s", tokens)
-        st = SyntaxTree(Context, tokens)
+        st = SyntaxTree(Context, tokens, self.interner)
         st.run()
+        return st
+
+    def execute(self, src, op_limit=-1, time_limit=-1, slice_ops=None):
+        # with slice_ops the script stops after roughly that many
+        # operations and an Execution handle is returned, call resume()
+        # on it until it returns True
+        self.reset_instrumentation()
+        st = self.compile(src)
+        if slice_ops is not None:
+            return self.start(st, slice_ops, op_limit=op_limit,
+                              time_limit=time_limit)
         st.execute(self, op_limit=op_limit, time_limit=time_limit)
         return True
 
+    def start(self, syntax_tree, slice_ops, op_limit=-1, time_limit=-1):
+        self.reset_instrumentation()
+        self.set_op_limit(op_limit)
+        self.set_time_limit(time_limit)
+        return Execution(self, syntax_tree.tree, slice_ops).resume()
+
+    def execute_async(self, src, loop=None, slice_ops=1000, op_limit=-1,
+                      time_limit=-1):
+        # returns a future on the loop that resolves to this context,
+        # bound functions may return coroutines or futures
+        return aio.execute_async(self, self.compile(src), loop=loop,
+                                 slice_ops=slice_ops, op_limit=op_limit,
+                                 time_limit=time_limit)
+
     def __repr__(self):
         return '{%s}' % ', '.join(["%s: %s" % (k, v) for k, v in self.iteritems()])
+
+
+class FrozenContext(Context):
+
+    fork_class = Context
+
+    def __setitem__(self, key, value):
+        raise Exception("Context snapshots are read-only, fork() it first")
+
+    def __delitem__(self, key):
+        raise Exception("Context snapshots are read-only, fork() it first")
@@ -0,0 +1,54 @@
+from decimal import Decimal
+from .. import containers
+
+# Every node costs one operation. A cost model charges extra operations
+# for work that grows with the size of the values involved, so an op
+# budget also bounds the time spent concatenating big strings, building
+# big literals or multiplying big numbers. Multiplication and exponents
+# are charged from their operands before they're computed, so the limit
+# is hit before the work is done. Subclass it to weigh things
+# differently.
+
+
+def digits(value):
+    # numbers in scripts are Decimals, their size is the digit count
+    return len(value.as_tuple().digits)
+
+
+class CostModel(object):
+
+    def __init__(self, bytes_per_op=64, element_cost=1):
+        # a string or container of bytes_per_op characters/items costs
+        # one more operation, literals cost element_cost per element
+        self.bytes_per_op = bytes_per_op
+        self.element_cost = element_cost
+
+    def size_cost(self, value):
+        # bytes_per_op characters, items or digits cost one operation
+        if isinstance(value, Decimal):
+            return digits(value) // self.bytes_per_op
+        if isinstance(value, basestring) or \
+                isinstance(value, containers.CONTAINER_TYPES):
+            return len(value) // self.bytes_per_op
+        return 0
+
+    def binary_cost(self, node, left, right, result):
+        # addition, charged once the result is known
+        return self.size_cost(result)
+
+    def multiplication_cost(self, node, left, right):
+        # the product has about as many digits as both factors together
+        if isinstance(left, Decimal) and isinstance(right, Decimal):
+            return (digits(left) + digits(right)) // self.bytes_per_op
+        return 0
+
+    def exponent_cost(self, node, base, exponent):
+        # the power has about digits(base) * exponent digits
+        if not isinstance(base, Decimal) or \
+                not isinstance(exponent, Decimal) or \
+                not exponent.is_finite():
+            return 0
+        return digits(base) * abs(int(exponent)) // self.bytes_per_op
+
+    def literal_cost(self, node, num_elements):
+        return num_elements * self.element_cost
@@ -0,0 +1,169 @@
+import datetime
+import logging
+from .. import exceptions
+from ..syntax_tree import nodes
+
+# Statements and loops are run from an explicit stack of frames so a
+# script can stop between two statements and pick up there later.
+# Expressions, including calls to script functions, are still reduced
+# in one go, so a slice can overrun its budget by one statement.
+#
+# When is_awaitable is set, a host function returning something it
+# accepts suspends the script. The statement is run again once the
+# result is in, with the results of the host calls it already made
+# replayed in order, so host functions aren't called twice, and the
+# operations and memory of the first attempt given back. Script
+# functions would run again and repeat their side effects, so a
+# statement that calls one can't suspend.
+
+
+class BranchFrame(object):
+
+    def __init__(self, branch):
+        self.branch = branch
+        self.pc = 0
+
+    def step(self, execution):
+        if self.pc >= len(self.branch):
+            execution.frames.pop()
+            return
+        node = self.branch[self.pc]
+        self.pc += 1
+        state = execution.context.state
+        operations, memory = state.operations_counted, state.memory_used
+        try:
+            execution.execute_statement(node)
+        except exceptions.SuspendExecution:
+            # run the whole statement again once the host call is done,
+            # charging it once
+            self.pc -= 1
+            state.operations_counted = operations
+            state.memory_used = memory
+            raise
+        except (exceptions.ReturnRequestedException,
+                exceptions.EndContextExecution):
+            # same as Branch.execute, leave the innermost branch
+            while execution.frames.pop() is not self:
+                pass
+
+
+class WhileFrame(object):
+
+    def __init__(self, node):
+        self.node = node
+
+    def step(self, execution):
+        result = self.node.condition.reduce(execution.context)
+        logging.debug("While result: %s", result)
+        if not result:
+            execution.frames.pop()
+        else:
+            execution.frames.append(BranchFrame(self.node.branch))
+
+
+class ForFrame(object):
+
+    def __init__(self, node, items):
+        self.node = node
+        self.items = items
+        self.position = 0
+
+    def step(self, execution):
+        if self.position >= len(self.items):
+            execution.frames.pop()
+            return
+        # same as python. variable is set in the outer context
+        execution.context[self.node.local_name] = self.items[self.position]
+        self.position += 1
+        execution.frames.append(BranchFrame(self.node.branch))
+
+
+class Execution(object):
+
+    def __init__(self, context, tree, slice_ops):
+        self.context = context
+        self.tree = tree
+        self.slice_ops = slice_ops
+        self.frames = [BranchFrame(tree)]
+        self.elapsed = datetime.timedelta(0)
+        self.slices = 0
+        self.is_awaitable = None
+        self.call_index = 0
+        self.recorded = []
+        # script functions called by the current statement
+        self.function_calls = 0
+        self.line_num = 0
+
+    @property
+    def finished(self):
+        return len(self.frames) == 0
+
+    def execute_statement(self, node):
+        context = self.context
+        self.line_num = node.line_num
+        if isinstance(node, nodes.IfNode):
+            context.increment_operations()
+            result = node.condition.reduce(context)
+            logging.debug("If result: %s", result)
+            if result:
+                self.frames.append(BranchFrame(node.then_branch))
+            elif len(node.else_branch) > 0:
+                self.frames.append(BranchFrame(node.else_branch))
+        elif isinstance(node, nodes.WhileNode):
+            context.increment_operations()
+            self.frames.append(WhileFrame(node))
+        elif isinstance(node, nodes.ForNode):
+            context.increment_operations()
+            items = list(node.iterable.reduce(context))
+            self.frames.append(ForFrame(node, items))
+        else:
+            node.reduce(context)
+
+    def call_host(self, name, func, args):
+        state = self.context.state
+        if self.is_awaitable is None:
+            return state.call_host(name, func, args)
+        index = self.call_index
+        self.call_index += 1
+        if index < len(self.recorded):
+            failed, value = self.recorded[index]
+            if failed:
+                raise value
+            return value
+        result = state.call_host(name, func, args)
+        if self.is_awaitable(result):
+            if self.function_calls:
+                raise exceptions.SaulRuntimeError(
+                    self.line_num, "%s can't be awaited in a statement that "
+                    "calls a script function" % name)
+            raise exceptions.SuspendExecution(result)
+        self.recorded.append((False, result))
+        return result
+
+    def resolve(self, value, failed=False):
+        # the outcome of the host call the script is suspended on
+        self.recorded.append((failed, value))
+
+    def resume(self):
+        # returns True once the script is done, otherwise this handle
+        context = self.context
+        # time spent paused doesn't count against the time limit
+        context.start_time = datetime.datetime.now() - self.elapsed
+        context.execution = self
+        budget = context.operations_counted + self.slice_ops
+        self.slices += 1
+        frames = self.frames
+        try:
+            while frames:
+                if context.operations_counted >= budget:
+                    logging.debug("Pausing after %d slices", self.slices)
+                    return self
+                self.call_index = 0
+                self.function_calls = 0
+                frames[-1].step(self)
+                if self.recorded:
+                    self.recorded = []
+            return True
+        finally:
+            self.elapsed = datetime.datetime.now() - context.start_time
+            context.execution = None
@@ -0,0 +1,138 @@
+import fnmatch
+import logging
+import multiprocessing
+import os
+from .. import exceptions
+from ..clock import clock
+from ..lexer import Lexer
+from ..syntax_tree import SyntaxTree
+from .bundle import BundleWriter
+from .context import Context
+from .sandbox import source_hash
+
+# Lex and parse a directory of scripts across a process pool. Workers
+# send back the root branch of each syntax tree, nodes pickle fine, and
+# the parent wraps them in SyntaxTree objects or writes them straight
+# into a bundle. Parse errors don't stop the load, they're collected
+# with the file and line they happened on.
+
+
+class LoadError(object):
+
+    def __init__(self, path, line_num, message):
+        self.path = path
+        self.line_num = line_num
+        self.message = message
+
+    def __repr__(self):
+        return '%s:%s: %s' % (self.path, self.line_num, self.message)
+
+
+def _error_info(e):
+    # some errors are raised without a line number or a message
+    line_num = getattr(e, 'line_num', 0)
+    message = getattr(e, 'message', None)
+    if not isinstance(line_num, (int, long)):
+        line_num, message = 0, message or line_num
+    return line_num, '%s: %s' % (e.__class__.__name__,
+                                 message or 'invalid syntax')
+
+
+def _compile_file(job):
+    root, name = job
+    with open(os.path.join(root, name)) as f:
+        src = f.read()
+    started = clock()
+    lexed = parsed = None
+    try:
+        tokens = Lexer(src + "\n").run()
+        lexed = clock()
+        st = SyntaxTree(Context, tokens)
+        st.run()
+        parsed = clock()
+    except (exceptions.SaulException, exceptions.EndOfFileException) as e:
+        failed = clock()
+        if lexed is None:
+            lexed = failed
+        return (name, None, None, _error_info(e), lexed - started,
+                failed - lexed)
+    return (name, st.tree, source_hash(src), None, lexed - started,
+            parsed - lexed)
+
+
+def find_scripts(path, pattern='*.lv'):
+    # paths relative to path, in a stable order
+    names = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(fnmatch.filter(files, pattern)):
+            names.append(os.path.relpath(os.path.join(root, name), path))
+    return names
+
+
+class LoadResult(object):
+
+    def __init__(self):
+        # trees is empty when loading into a bundle
+        self.trees = {}
+        self.errors = []
+        # {name: (lex seconds, parse seconds)}
+        self.timings = {}
+        self.elapsed = 0.0
+        self.bundle = None
+
+    def slowest(self, limit=10):
+        return sorted(self.timings.iteritems(),
+                      key=lambda item: -sum(item[1]))[:limit]
+
+    def report(self, limit=10):
+        lex_time = sum(t[0] for t in self.timings.itervalues())
+        parse_time = sum(t[1] for t in self.timings.itervalues())
+        lines = ['%d scripts in %.2fs (lex %.2fs, parse %.2fs), %d errors' % (
+            len(self.timings), self.elapsed, lex_time, parse_time,
+            len(self.errors))]
+        for error in self.errors:
+            lines.append('  %r' % error)
+        for name, (lexed, parsed) in self.slowest(limit):
+            lines.append('  %8.2fms %s' % ((lexed + parsed) * 1000, name))
+        return '\n'.join(lines)
+
+
+def load_directory(path, processes=None, pattern='*.lv', bundle=None,
+                   interner=None, chunksize=8):
+    # one process per core by default, with a single one the scripts
+    # load in this process. With bundle, a file path, the trees are
+    # written there and not kept in memory.
+    started = clock()
+    processes = processes or multiprocessing.cpu_count()
+    result = LoadResult()
+    jobs = [(path, name) for name in find_scripts(path, pattern)]
+    writer = BundleWriter(bundle) if bundle is not None else None
+    pool = None
+    if processes == 1:
+        compiled = (_compile_file(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        compiled = pool.imap_unordered(_compile_file, jobs, chunksize)
+    try:
+        for name, tree, digest, error, lex_time, parse_time in compiled:
+            result.timings[name] = (lex_time, parse_time)
+            if error is not None:
+                result.errors.append(LoadError(name, *error))
+            elif writer is not None:
+                writer.add_tree(name, digest, tree)
+            else:
+                st = SyntaxTree(Context, [], interner)
+                st.tree = interner.intern(tree) if interner else tree
+                result.trees[name] = st
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if writer is not None:
+            writer.close()
+            result.bundle = bundle
+    result.errors.sort(key=lambda error: (error.path, error.line_num))
+    result.elapsed = clock() - started
+    logging.debug("Loaded %d scripts from %s", len(jobs), path)
+    return result
@@ -0,0 +1,204 @@
+from collections import OrderedDict
+import bisect
+import threading
+from .. import exceptions
+from ..clock import clock
+
+# Counters and histograms aggregated over many executions, labeled by
+# script id. Nothing is served, call export_prometheus(registry) and put
+# the text wherever the scraper can get it.
+
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+OPS_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+
+LIMIT_ERRORS = (exceptions.OperationLimitReached, exceptions.TimeLimitReached,
+                exceptions.MemoryLimitReached)
+
+
+class Metric(object):
+
+    kind = None
+
+    def __init__(self, name, help_text, lock):
+        self.name = name
+        self.help_text = help_text
+        self.lock = lock
+        # sorted label items -> value
+        self.values = OrderedDict()
+
+    def key(self, labels):
+        return tuple(sorted(labels.iteritems()))
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, lock, buckets=SECONDS_BUCKETS):
+        super(Histogram, self).__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # a count per bucket, then the +Inf count and the sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = OrderedDict()
+        # (script id, cache name) -> hits seen last time
+        self.cache_hits_seen = {}
+        self.parse_seconds = self.histogram(
+            'saulscript_parse_seconds', 'Time spent lexing and parsing')
+        self.execution_seconds = self.histogram(
+            'saulscript_execution_seconds', 'Time spent running a script')
+        self.execution_ops = self.histogram(
+            'saulscript_execution_operations',
+            'Operations counted per execution', buckets=OPS_BUCKETS)
+        self.executions = self.counter(
+            'saulscript_executions_total', 'Finished executions')
+        self.host_calls = self.counter(
+            'saulscript_host_calls_total', 'Calls to bound functions')
+        self.host_seconds = self.counter(
+            'saulscript_host_seconds_total', 'Time spent in bound functions')
+        self.cache_hits = self.counter(
+            'saulscript_cache_hits_total',
+            'Hits in bound function caches and memoized script functions')
+        self.limit_violations = self.counter(
+            'saulscript_limit_violations_total',
+            'Executions stopped by an operation, time or memory limit')
+        self.errors = self.counter(
+            'saulscript_errors_total', 'Executions stopped by other errors')
+
+    def add(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise Exception("Metric %s already exists" % metric.name)
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self.add(Counter(name, help_text, self.lock))
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        return self.add(Histogram(name, help_text, self.lock, buckets))
+
+    def compile(self, script_id, context, src):
+        started = clock()
+        syntax_tree = context.compile(src)
+        self.parse_seconds.observe(clock() - started, script=script_id)
+        return syntax_tree
+
+    def run(self, script_id, context, syntax_tree, op_limit=-1,
+            time_limit=-1):
+        started = clock()
+        try:
+            context.reset_instrumentation()
+            syntax_tree.execute(context, op_limit=op_limit,
+                                time_limit=time_limit)
+        except Exception as e:
+            self.record_error(script_id, context, e)
+            raise
+        self.record_execution(script_id, context, clock() - started)
+        return context
+
+    def record_execution(self, script_id, context, seconds):
+        self.executions.inc(script=script_id)
+        self.execution_seconds.observe(seconds, script=script_id)
+        self.execution_ops.observe(context.operations_counted,
+                                   script=script_id)
+        self.record_host_calls(script_id, context)
+
+    def record_error(self, script_id, context, error):
+        if isinstance(error, LIMIT_ERRORS):
+            self.limit_violations.inc(script=script_id,
+                                      limit=error.__class__.__name__)
+        else:
+            self.errors.inc(script=script_id, error=error.__class__.__name__)
+        self.record_host_calls(script_id, context)
+
+    def record_host_calls(self, script_id, context):
+        for name, stats in context.host_stats().iteritems():
+            self.host_calls.inc(stats['calls'], script=script_id,
+                                function=name)
+            self.host_seconds.inc(stats['seconds'], script=script_id,
+                                  function=name)
+        # cache stats are running totals, count what's new since last time.
+        # a cache shared by several scripts is counted against each of them
+        caches = dict((name, stats['hits'])
+                      for name, stats in context.cache_stats().iteritems())
+        caches['memoized'] = context.memo_stats()['hits']
+        for name, hits in caches.iteritems():
+            key = (script_id, name)
+            seen = self.cache_hits_seen.get(key, 0)
+            self.cache_hits_seen[key] = hits
+            # fewer hits than before means a new cache, count them all
+            new_hits = hits - seen if hits >= seen else hits
+            if new_hits:
+                self.cache_hits.inc(new_hits, script=script_id, cache=name)
+
+
+def _escape(value):
+    return unicode(value).replace('\\', '\\\\').replace(
+        '\n', '\\n').replace('"', '\\"')
+
+
+def _labels(items):
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in items)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def export_prometheus(registry):
+    # the registry in the Prometheus text exposition format
+    out = []
+    with registry.lock:
+        # copy histogram counts too, they're updated in place
+        metrics = [(metric, [(key, list(value) if isinstance(value, list)
+                              else value)
+                             for key, value in metric.values.iteritems()])
+                   for metric in registry.metrics.itervalues()]
+    for metric, values in metrics:
+        out.append('# HELP %s %s' % (metric.name, metric.help_text))
+        out.append('# TYPE %s %s' % (metric.name, metric.kind))
+        for key, value in values:
+            if metric.kind != 'histogram':
+                out.append('%s%s %s' % (metric.name, _labels(key),
+                                        _number(value)))
+                continue
+            total = 0
+            for bound, count in zip(metric.buckets + (float('inf'),),
+                                    value[:-1]):
+                total += count
+                out.append('%s_bucket%s %d' % (
+                    metric.name, _labels(key + (('le', _number(bound)),)),
+                    total))
+            out.append('%s_sum%s %s' % (metric.name, _labels(key),
+                                        _number(value[-1])))
+            out.append('%s_count%s %d' % (metric.name, _labels(key), total))
+    return '\n'.join(out) + '\n'
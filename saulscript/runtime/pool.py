@@ -0,0 +1,203 @@
+from collections import deque
+import bisect
+import hashlib
+import logging
+import threading
+from .. import exceptions
+from ..clock import clock
+from .sandbox import SandboxWorker, SandboxKilled, source_hash
+from .stats import summarize
+
+# A pool of long-lived sandbox workers. Jobs for the same source go to
+# the same worker (consistent hashing on the source hash) so it can
+# reuse the syntax tree it already compiled. A job is sent elsewhere if
+# its worker's queue is too deep, and idle workers steal queued jobs
+# from the busiest worker.
+
+
+class PoolJob(object):
+
+    def __init__(self, digest, src, values, op_limit, time_limit,
+                 wall_limit):
+        self.digest = digest
+        self.src = src
+        self.values = values
+        self.op_limit = op_limit
+        self.time_limit = time_limit
+        self.wall_limit = wall_limit
+        self.submitted = clock()
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise exceptions.TimeLimitReached(clock() - self.submitted)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class HashRing(object):
+
+    def __init__(self, slots, replicas=64):
+        self.keys = []
+        self.slots = []
+        ring = sorted((self.position('%d:%d' % (slot, replica)), slot)
+                      for slot in range(slots) for replica in range(replicas))
+        for key, slot in ring:
+            self.keys.append(key)
+            self.slots.append(slot)
+
+    def position(self, key):
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+    def slot(self, key):
+        index = bisect.bisect(self.keys, self.position(key)) % len(self.keys)
+        return self.slots[index]
+
+
+class PoolSlot(object):
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.queue = deque()
+        self.busy = False
+        self.worker = pool.spawn()
+        self.thread = threading.Thread(target=self.dispatch)
+        self.thread.daemon = True
+
+    def dispatch(self):
+        pool = self.pool
+        while True:
+            job = pool.next_job(self)
+            if job is None:
+                return
+            try:
+                job.value = self.worker.run(
+                    job.src, job.values, job.op_limit, job.time_limit,
+                    job.wall_limit, digest=job.digest)
+            except SandboxKilled as e:
+                self.worker = pool.replace(self.worker)
+                job.error = e
+            except (EOFError, IOError):
+                self.worker = pool.replace(self.worker)
+                job.error = exceptions.SaulRuntimeError(
+                    0, "Sandbox worker died")
+            except Exception as e:
+                job.error = e
+            pool.finished(self, job)
+            job.done.set()
+
+
+class WorkerPool(object):
+
+    def __init__(self, processes=4, bindings=None, callbacks=None,
+                 wall_limit=5, memory_limit=None, cache_size=256,
+                 max_queue=8, latency_samples=10000):
+        self.bindings = bindings
+        self.callbacks = callbacks or {}
+        self.wall_limit = wall_limit
+        self.memory_limit = memory_limit
+        self.cache_size = cache_size
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.closed = False
+        self.started = clock()
+        self.completed = 0
+        self.failed = 0
+        self.rerouted = 0
+        self.stolen = 0
+        self.latencies = deque(maxlen=latency_samples)
+        self.ring = HashRing(processes)
+        self.slots = [PoolSlot(self, index) for index in range(processes)]
+        for slot in self.slots:
+            slot.thread.start()
+
+    def spawn(self):
+        return SandboxWorker(self.bindings, self.callbacks,
+                             self.memory_limit, self.cache_size)
+
+    def replace(self, worker):
+        worker.kill()
+        return self.spawn()
+
+    def submit(self, src, values=None, op_limit=-1, time_limit=-1,
+               wall_limit=None):
+        digest = source_hash(src)
+        job = PoolJob(digest, src, values or {}, op_limit, time_limit,
+                      self.wall_limit if wall_limit is None else wall_limit)
+        with self.condition:
+            if self.closed:
+                raise Exception("Pool is closed")
+            slot = self.slots[self.ring.slot(digest)]
+            if len(slot.queue) >= self.max_queue:
+                # the preferred worker is swamped, take the compile cost
+                # on the least loaded one instead
+                slot = min(self.slots, key=lambda s: len(s.queue))
+                self.rerouted += 1
+            slot.queue.append(job)
+            self.condition.notify_all()
+        return job
+
+    def execute(self, src, values=None, op_limit=-1, time_limit=-1,
+                wall_limit=None):
+        return self.submit(src, values, op_limit, time_limit,
+                           wall_limit).result()
+
+    def next_job(self, slot):
+        with self.condition:
+            while True:
+                if slot.queue:
+                    slot.busy = True
+                    return slot.queue.popleft()
+                busiest = max(self.slots, key=lambda s: len(s.queue))
+                if busiest.queue and busiest.busy:
+                    # the owner will get to its next job, take the last one
+                    self.stolen += 1
+                    logging.debug("Worker %d steals from worker %d",
+                                  slot.index, busiest.index)
+                    slot.busy = True
+                    return busiest.queue.pop()
+                if self.closed:
+                    # queued jobs are drained before the workers stop,
+                    # callers may be waiting on them without a timeout
+                    return None
+                self.condition.wait()
+
+    def finished(self, slot, job):
+        with self.condition:
+            slot.busy = False
+            # a queued job may be waiting for an idle worker to steal it
+            self.condition.notify_all()
+            self.latencies.append(clock() - job.submitted)
+            if job.error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        with self.condition:
+            latencies = list(self.latencies)
+            elapsed = clock() - self.started
+            stats = {
+                'completed': self.completed,
+                'failed': self.failed,
+                'rerouted': self.rerouted,
+                'stolen': self.stolen,
+                'queued': sum(len(slot.queue) for slot in self.slots),
+                'throughput': self.completed / elapsed if elapsed else 0.0,
+                'cache_hits': sum(slot.worker.cache_hits
+                                  for slot in self.slots),
+            }
+        stats['latency'] = summarize(latencies)
+        return stats
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for slot in self.slots:
+            slot.thread.join()
+            slot.worker.stop()
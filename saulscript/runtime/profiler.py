@@ -0,0 +1,112 @@
+from .. import exceptions
+from ..clock import clock
+
+# Counts operations, runs and time per source line and per script
+# function. Branches and script function calls hand over to the
+# profiler when Context.profiler is set, otherwise nothing is measured.
+# Line numbers are those of the statements, numbers are "self", i.e.
+# without the statements nested in them, function numbers include
+# everything the function did. A profiler isn't thread safe, give each
+# context being profiled its own.
+
+
+class Profiler(object):
+
+    def __init__(self):
+        # line -> [ops, runs, seconds]
+        self.lines = {}
+        # function name -> [calls, ops, seconds]
+        self.functions = {}
+        # folded stack -> [ops, seconds]
+        self.stacks = {}
+        self.call_stack = ['script']
+        # [ops, seconds] of nested statements, one per open statement
+        self.open = []
+
+    def execute_branch(self, branch, context):
+        # Branch.execute with every statement measured
+        state = context.state
+        for node in branch:
+            ops = state.operations_counted
+            started = clock()
+            self.open.append([0, 0.0])
+            try:
+                node.reduce(context)
+            except exceptions.ReturnRequestedException:
+                break
+            except exceptions.EndContextExecution:
+                break
+            finally:
+                self.record(node.line_num,
+                            state.operations_counted - ops,
+                            clock() - started)
+        return context.return_value
+
+    def record(self, line_num, ops, seconds):
+        nested_ops, nested_seconds = self.open.pop()
+        if self.open:
+            self.open[-1][0] += ops
+            self.open[-1][1] += seconds
+        ops -= nested_ops
+        seconds -= nested_seconds
+        stats = self.lines.get(line_num)
+        if stats is None:
+            stats = self.lines[line_num] = [0, 0, 0.0]
+        stats[0] += ops
+        stats[1] += 1
+        stats[2] += seconds
+        stack = '%s;line %d' % (';'.join(self.call_stack), line_num)
+        stats = self.stacks.get(stack)
+        if stats is None:
+            stats = self.stacks[stack] = [0, 0.0]
+        stats[0] += ops
+        stats[1] += seconds
+
+    def call_function(self, name, func, args, context):
+        state = context.state
+        ops = state.operations_counted
+        started = clock()
+        self.call_stack.append(name)
+        try:
+            return func(*args)
+        finally:
+            self.call_stack.pop()
+            stats = self.functions.get(name)
+            if stats is None:
+                stats = self.functions[name] = [0, 0, 0.0]
+            stats[0] += 1
+            stats[1] += state.operations_counted - ops
+            stats[2] += clock() - started
+
+    def reset(self):
+        self.lines.clear()
+        self.functions.clear()
+        self.stacks.clear()
+
+    def folded(self, weight='ops'):
+        # "script;func;line 12 340" lines for flamegraph.pl and friends,
+        # weighted by ops or by microseconds
+        lines = []
+        for stack, (ops, seconds) in sorted(self.stacks.iteritems()):
+            value = ops if weight == 'ops' else int(seconds * 1000000)
+            if value > 0:
+                lines.append('%s %d' % (stack, value))
+        return '\n'.join(lines) + '\n'
+
+    def report(self, limit=20):
+        out = ['%6s %10s %8s %10s' % ('line', 'ops', 'runs', 'ms')]
+        ordered = sorted(self.lines.iteritems(),
+                         key=lambda item: item[1][0], reverse=True)
+        for line_num, (ops, runs, seconds) in ordered[:limit]:
+            out.append('%6d %10d %8d %10.3f' % (
+                line_num, ops, runs, seconds * 1000))
+        if self.functions:
+            out.append('')
+            out.append('%-20s %8s %10s %10s' % (
+                'function', 'calls', 'ops', 'ms'))
+            ordered = sorted(self.functions.iteritems(),
+                             key=lambda item: item[1][1], reverse=True)
+            for name, (calls, ops, seconds) in ordered[:limit]:
+                out.append('%-20s %8d %10d %10.3f' % (
+                    name, calls, ops, seconds * 1000))
+        return '\n'.join(out)
@@ -0,0 +1,110 @@
+from collections import Counter, deque
+import signal
+import sys
+from ..syntax_tree import SyntaxTree, nodes
+from .execution import BranchFrame
+from .profiler import Profiler
+
+# Records where scripts are every N operations, or every N seconds of
+# CPU time with start_timer(). The statement and the script functions
+# being run are read off the Python stack when a sample is taken, so
+# nothing is done for the operations in between. Samples go to a ring
+# buffer, older ones are dropped.
+
+# code objects running statements, and the local holding the statement
+_STATEMENT_CODE = {
+    nodes.Branch.execute.im_func.func_code: 'node',
+    BranchFrame.step.im_func.func_code: 'node',
+    SyntaxTree.execute.im_func.func_code: 'expression',
+    Profiler.execute_branch.im_func.func_code: 'node',
+}
+_INVOCATION_CODE = nodes.InvocationNode.reduce.im_func.func_code
+
+
+def _where(frame):
+    # (script function names outermost first, line of the statement)
+    functions = []
+    line_num = None
+    while frame is not None:
+        code = frame.f_code
+        if code is _INVOCATION_CODE:
+            f_locals = frame.f_locals
+            # args are set once the call has started
+            if 'args' in f_locals and isinstance(
+                    f_locals.get('callable_item'), nodes.ScriptFunction):
+                functions.append(f_locals['self'].callable_name)
+        elif line_num is None and code in _STATEMENT_CODE:
+            node = frame.f_locals.get(_STATEMENT_CODE[code])
+            if node is not None:
+                line_num = node.line_num
+        frame = frame.f_back
+    functions.reverse()
+    return tuple(functions), line_num
+
+
+class Sampler(object):
+
+    def __init__(self, every_ops=1000, maxlen=10000):
+        self.every_ops = every_ops
+        self.samples = deque(maxlen=maxlen)
+        self.timer_interval = None
+
+    def sample(self, frame=None):
+        if frame is None:
+            frame = sys._getframe(1)
+        functions, line_num = _where(frame)
+        if line_num is not None:
+            self.samples.append((functions, line_num))
+
+    def attach(self, state):
+        # sample every every_ops operations counted on the execution state
+        sampler = self
+        every_ops = self.every_ops
+        countdown = [every_ops]
+        increment = state.__class__.increment
+
+        def sampled_increment(num=1):
+            increment(state, num)
+            countdown[0] -= num
+            if countdown[0] <= 0:
+                countdown[0] = every_ops
+                sampler.sample(sys._getframe(1))
+        state.increment = sampled_increment
+
+    def detach(self, state):
+        state.__dict__.pop('increment', None)
+
+    def start_timer(self, interval=0.005):
+        # CPU time based sampling, main thread only
+        self.timer_interval = interval
+        signal.signal(signal.SIGPROF, self._on_timer)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop_timer(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self.timer_interval = None
+
+    def _on_timer(self, signum, frame):
+        self.sample(frame)
+
+    def clear(self):
+        self.samples.clear()
+
+    def histogram(self):
+        return Counter(self.samples)
+
+    def lines(self):
+        return Counter(line_num for functions, line_num in self.samples)
+
+    def functions(self):
+        return Counter(functions[-1] if functions else 'script'
+                       for functions, line_num in self.samples)
+
+    def folded(self):
+        lines = []
+        for (functions, line_num), count in sorted(
+                self.histogram().iteritems()):
+            lines.append('%s;line %d %d' % (
+                ';'.join(('script',) + functions), line_num, count))
+        return '\n'.join(lines) + '\n'
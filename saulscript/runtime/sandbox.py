@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import Queue
+from .. import containers
+from .. import exceptions
+from ..clock import clock
+from .context import Context
+from .cache import LRUCache
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Scripts run in forked worker processes. Host bindings are inherited
+# by the fork and run inside the worker, so a host function that hangs
+# is killed along with the script. Callbacks run in the parent process
+# and are reached from the worker through the worker's pipe. Workers
+# keep the syntax trees of recently run scripts, keyed by source hash.
+
+_missing = object()
+
+
+class SandboxKilled(exceptions.TimeLimitReached):
+    pass
+
+
+def _marshal_exception(e):
+    if isinstance(e, exceptions.TimeLimitReached):
+        return (e.__class__.__name__, 0, e.total_seconds)
+    if isinstance(e, exceptions.MemoryLimitReached):
+        return (e.__class__.__name__, 0, e.bytes_used)
+    return (e.__class__.__name__, getattr(e, 'line_num', 0),
+            getattr(e, 'message', None) or str(e))
+
+
+def _raise_remote(name, line_num, message):
+    cls = getattr(exceptions, name, None)
+    if cls is exceptions.OperationLimitReached:
+        raise exceptions.OperationLimitReached()
+    if cls is exceptions.TimeLimitReached:
+        raise exceptions.TimeLimitReached(message)
+    if cls is exceptions.MemoryLimitReached:
+        raise exceptions.MemoryLimitReached(message)
+    if cls is not None and issubclass(cls, exceptions.SaulException) and \
+            cls not in (exceptions.EndContextExecution,
+                        exceptions.UnexpectedCharacter):
+        raise cls(line_num, message)
+    raise exceptions.SaulRuntimeError(line_num, "%s: %s" % (name, message))
+
+
+def _result_names(context):
+    # only data goes back to the parent, functions stay in the worker
+    return dict((name, containers.unwrap(value))
+                for name, value in context.flatten().iteritems()
+                if not callable(value))
+
+
+def _callback_proxy(conn, name):
+    def proxy(*args):
+        conn.send(('call', name, args))
+        kind, value = conn.recv()
+        if kind == 'error':
+            raise exceptions.SaulRuntimeError(0, value)
+        return value
+    return proxy
+
+
+def source_hash(src):
+    return hashlib.sha1(src).hexdigest()
+
+
+def _worker_main(conn, bindings, callback_names, memory_limit, cache_size):
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    compiled = LRUCache(cache_size)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        digest, src, values, op_limit, time_limit = job
+        context = Context(bindings=bindings)
+        for name in callback_names:
+            context.bind_function(name, _callback_proxy(conn, name))
+        try:
+            # bad values fail the job, not the worker
+            for name, value in values.iteritems():
+                context.bind_value(name, value)
+            syntax_tree = compiled.get(digest, _missing)
+            cache_hit = syntax_tree is not _missing
+            if not cache_hit:
+                syntax_tree = context.compile(src)
+                compiled.put(digest, syntax_tree)
+            context.reset_instrumentation()
+            syntax_tree.execute(context, op_limit=op_limit,
+                                time_limit=time_limit)
+            conn.send(('done', (_result_names(context),
+                                context.return_value,
+                                context.operations_counted,
+                                cache_hit)))
+        except MemoryError:
+            conn.send(('failed', ('MemoryError', 0, 'Out of memory')))
+        except Exception as e:
+            conn.send(('failed', _marshal_exception(e)))
+
+
+class SandboxWorker(object):
+
+    def __init__(self, bindings=None, callbacks=None, memory_limit=None,
+                 cache_size=64):
+        self.callbacks = callbacks or {}
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_conn, bindings, list(self.callbacks),
+                  memory_limit, cache_size))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.cache_hits = 0
+
+    def run(self, src, values, op_limit, time_limit, wall_limit,
+            digest=None):
+        started = clock()
+        deadline = started + wall_limit if wall_limit > 0 else None
+        self.jobs += 1
+        if digest is None:
+            digest = source_hash(src)
+        self.conn.send((digest, src, values, op_limit, time_limit))
+        while True:
+            timeout = None if deadline is None else deadline - clock()
+            if timeout is not None and \
+                    (timeout <= 0 or not self.conn.poll(timeout)):
+                raise SandboxKilled(clock() - started)
+            message = self.conn.recv()
+            if message[0] == 'call':
+                self.callback(message[1], message[2])
+            elif message[0] == 'done':
+                names, return_value, operations, cache_hit = message[1]
+                self.cache_hits += cache_hit
+                return SandboxResult(names, return_value, operations,
+                                     clock() - started)
+            else:
+                _raise_remote(*message[1])
+
+    def callback(self, name, args):
+        try:
+            self.conn.send(('result', self.callbacks[name](*args)))
+        except Exception as e:
+            logging.error("Sandbox callback %s failed: %s", name, e)
+            self.conn.send(('error', "%s failed: %s" % (name, e)))
+
+    def kill(self):
+        logging.debug("Killing sandbox worker %d", self.process.pid)
+        self.process.terminate()
+        self.process.join(0.1)
+        if self.process.is_alive():
+            os.kill(self.process.pid, signal.SIGKILL)
+            self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except IOError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+
+class SandboxResult(object):
+
+    def __init__(self, names, return_value, operations_counted, seconds):
+        self.names = names
+        self.return_value = return_value
+        self.operations_counted = operations_counted
+        self.seconds = seconds
+
+    def __getitem__(self, name):
+        return self.names[name]
+
+
+class SandboxExecutor(object):
+
+    def __init__(self, processes=2, bindings=None, callbacks=None,
+                 wall_limit=5, memory_limit=None):
+        self.bindings = bindings
+        self.callbacks = callbacks or {}
+        self.wall_limit = wall_limit
+        self.memory_limit = memory_limit
+        self.idle = Queue.Queue()
+        self.workers = []
+        for i in range(processes):
+            self.idle.put(self.spawn())
+
+    def spawn(self):
+        worker = SandboxWorker(self.bindings, self.callbacks,
+                               self.memory_limit)
+        self.workers.append(worker)
+        return worker
+
+    def replace(self, worker):
+        worker.kill()
+        self.workers.remove(worker)
+        return self.spawn()
+
+    def execute(self, src, values=None, op_limit=-1, time_limit=-1,
+                wall_limit=None):
+        # blocks until a worker is free, safe to call from many threads
+        wall_limit = self.wall_limit if wall_limit is None else wall_limit
+        worker = self.idle.get()
+        try:
+            result = worker.run(src, values or {}, op_limit, time_limit,
+                                wall_limit)
+        except SandboxKilled:
+            worker = self.replace(worker)
+            raise
+        except (EOFError, IOError):
+            # the worker died, e.g. the memory limit was hit
+            worker = self.replace(worker)
+            raise exceptions.SaulRuntimeError(0, "Sandbox worker died")
+        finally:
+            self.idle.put(worker)
+        return result
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
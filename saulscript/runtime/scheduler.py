@@ -0,0 +1,156 @@
+from collections import OrderedDict
+import logging
+from .. import exceptions
+from ..clock import clock
+from .stats import summarize
+
+SCRIPT_ERRORS = (exceptions.SaulException, exceptions.OperationLimitReached,
+                 exceptions.TimeLimitReached, exceptions.MemoryLimitReached)
+
+
+class ScheduledScript(object):
+
+    def __init__(self, script_id, context, syntax_tree, weight=1,
+                 repeat=True):
+        self.script_id = script_id
+        self.context = context
+        self.syntax_tree = syntax_tree
+        self.weight = weight
+        self.repeat = repeat
+        self.execution = None
+        self.deficit = 0
+        self.overruns = 0
+        self.runs = 0
+        # time spent in the slices of the current run
+        self.run_time = 0.0
+
+
+class TickReport(object):
+
+    def __init__(self, tick, frame_time, latencies, ran, skipped,
+                 finished, errors):
+        self.tick = tick
+        self.frame_time = frame_time
+        self.latencies = latencies
+        self.ran = ran
+        self.skipped = skipped
+        self.finished = finished
+        self.errors = errors
+
+    def latency(self):
+        return summarize(self.latencies)
+
+    def __repr__(self):
+        latency = self.latency()
+        return '<tick %d: %.2fms, ran %d, skipped %d, p50 %.3fms, ' \
+            'p95 %.3fms, p99 %.3fms>' % (
+                self.tick, self.frame_time * 1000, self.ran, self.skipped,
+                latency['p50'] * 1000, latency['p95'] * 1000,
+                latency['p99'] * 1000)
+
+
+class Scheduler(object):
+    # Runs many scripts a slice at a time, round-robin. Every tick each
+    # script is credited ops_per_tick * weight operations (deficit round
+    # robin): a script that overruns its slice pays it back out of its
+    # next one, and scripts skipped because the frame time target was
+    # reached go first on the next tick, so nothing starves.
+
+    def __init__(self, ops_per_tick=100, frame_time=None, metrics=None):
+        self.ops_per_tick = ops_per_tick
+        self.frame_time = frame_time
+        # a runtime.metrics.MetricsRegistry finished runs are recorded in
+        self.metrics = metrics
+        self.scripts = OrderedDict()
+        self.tick_number = 0
+        self.last_report = None
+
+    def add(self, script_id, context, syntax_tree, weight=1, repeat=True):
+        if script_id in self.scripts:
+            raise Exception("Script %s is already scheduled" % script_id)
+        self.scripts[script_id] = ScheduledScript(
+            script_id, context, syntax_tree, weight=weight, repeat=repeat)
+
+    def remove(self, script_id):
+        return self.scripts.pop(script_id)
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def __contains__(self, script_id):
+        return script_id in self.scripts
+
+    def run_slice(self, script):
+        context = script.context
+        if script.execution is None:
+            context.reset_instrumentation()
+            budget = max(script.deficit, 1)
+            result = context.start(script.syntax_tree, budget,
+                                   op_limit=context.operation_limit,
+                                   time_limit=context.time_limit)
+        else:
+            budget = max(script.deficit, 1)
+            script.execution.slice_ops = budget
+            result = script.execution.resume()
+        script.execution = None if result is True else result
+        return result is True
+
+    def tick(self):
+        self.tick_number += 1
+        started = clock()
+        latencies = []
+        finished = []
+        errors = []
+        skipped = 0
+        order = list(self.scripts.values())
+        for index, script in enumerate(order):
+            if self.frame_time is not None and \
+                    clock() - started >= self.frame_time:
+                skipped = len(order) - index
+                break
+            script.deficit = min(
+                script.deficit + self.ops_per_tick * script.weight,
+                self.ops_per_tick * script.weight)
+            ops_before = script.context.operations_counted \
+                if script.execution is not None else 0
+            slice_started = clock()
+            try:
+                done = self.run_slice(script)
+            except Exception as e:
+                # host functions can raise anything, one broken script
+                # mustn't stop the others
+                if isinstance(e, SCRIPT_ERRORS):
+                    logging.error("Script %s failed: %s", script.script_id, e)
+                else:
+                    logging.exception("Script %s failed in host code",
+                                      script.script_id)
+                errors.append((script.script_id, e))
+                self.scripts.pop(script.script_id, None)
+                if self.metrics is not None:
+                    self.metrics.record_error(script.script_id,
+                                              script.context, e)
+                continue
+            finally:
+                latency = clock() - slice_started
+                latencies.append(latency)
+                script.run_time += latency
+            used = script.context.operations_counted - ops_before
+            script.deficit -= used
+            if script.deficit < 0:
+                script.overruns += 1
+            # move to the back of the line
+            self.scripts.pop(script.script_id, None)
+            if done:
+                script.runs += 1
+                finished.append(script.script_id)
+                if self.metrics is not None:
+                    self.metrics.record_execution(
+                        script.script_id, script.context, script.run_time)
+                script.run_time = 0.0
+                if not script.repeat:
+                    continue
+            self.scripts[script.script_id] = script
+        report = TickReport(self.tick_number, clock() - started, latencies,
+                            len(latencies), skipped, finished, errors)
+        self.last_report = report
+        return report
@@ -0,0 +1,19 @@
+import math
+
+
+def percentile(values, pct):
+    # nearest-rank percentile, values don't need to be sorted
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(math.ceil(pct / 100.0 * len(ordered))) - 1
+    return ordered[max(0, min(rank, len(ordered) - 1))]
+
+
+def summarize(values, percentiles=(50, 95, 99)):
+    summary = dict(('p%d' % pct, percentile(values, pct))
+                   for pct in percentiles)
+    summary['count'] = len(values)
+    summary['max'] = max(values) if values else 0.0
+    summary['mean'] = sum(values) / len(values) if values else 0.0
+    return summary
@@ -1,2 +1,3 @@
 import nodes
 from .syntax_tree import SyntaxTree
+from .intern import Interner
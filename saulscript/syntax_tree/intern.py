@@ -0,0 +1,84 @@
+from decimal import Decimal
+import threading
+import weakref
+import nodes
+
+# Hash-consing of syntax trees: structurally identical subtrees of all
+# the scripts compiled with the same interner share one set of nodes.
+# Nodes are never changed after parsing, so sharing them is safe. The
+# table holds weak references, nodes go away with the last script
+# using them. Line numbers are part of a node's identity unless
+# ignore_lines is set, then errors and profiles may report the line of
+# another script using the same code.
+
+
+def _slots(cls):
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in ('line_num', '__weakref__'):
+                names.append(name)
+    return tuple(names)
+
+
+class Interner(object):
+
+    def __init__(self, ignore_lines=False):
+        self.ignore_lines = ignore_lines
+        self.table = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key_of(self, value):
+        if isinstance(value, nodes.Node):
+            # children are interned first, so identity is enough
+            return id(value)
+        if isinstance(value, tuple):
+            return (type(value),) + tuple(self.key_of(v) for v in value)
+        if isinstance(value, Decimal):
+            # Decimal('1') == Decimal('1.0') but they print differently
+            return (Decimal, str(value))
+        return (type(value), value)
+
+    def intern(self, value):
+        # the shared copy of a node, branch or list literal
+        if isinstance(value, nodes.Node):
+            return self.intern_node(value)
+        if isinstance(value, tuple) and value:
+            items = [self.intern(v) for v in value]
+            if type(value) is nodes.Branch:
+                return nodes.make_branch(items)
+            return type(value)(items)
+        return value
+
+    def intern_node(self, node):
+        cls = node.__class__
+        slots = self.slots.get(cls)
+        if slots is None:
+            slots = self.slots[cls] = _slots(cls)
+        values = []
+        for name in slots:
+            value = self.intern(getattr(node, name))
+            # the node isn't shared yet, so it's fine to update it
+            setattr(node, name, value)
+            values.append(self.key_of(value))
+        line_num = None if self.ignore_lines else node.line_num
+        key = (cls, line_num) + tuple(values)
+        with self.lock:
+            try:
+                canonical = self.table.get(key)
+            except TypeError:
+                # unhashable value, keep the node to itself
+                return node
+            if canonical is not None:
+                self.hits += 1
+                return canonical
+            self.misses += 1
+            self.table[key] = node
+        return node
+
+    def stats(self):
+        return {'size': len(self.table), 'hits': self.hits,
+                'misses': self.misses}
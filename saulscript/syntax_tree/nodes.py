@@ -1,13 +1,54 @@
 from decimal import Decimal
+from numbers import Number
 import operator
 import logging
+import sys
 from .. import exceptions
+from .. import containers
+from ..runtime.cache import LRUCache, call_key
+
+# values that can be used as memoization keys and results
+MEMOIZABLE_TYPES = (Decimal, str, unicode, bool, type(None))
+
+_missing = object()
+
+
+# What a script can allocate: strings and containers. Numbers are left
+# out of memory accounting.
+SIZED_TYPES = (basestring,) + containers.CONTAINER_TYPES
+
+
+def _release(context, old):
+    # credit back a value an assignment replaced, unless something else
+    # still refers to it: another variable, a container or a syntax tree
+    # holding a literal. Four references are ours: the caller's local
+    # and the argument it pushed, this parameter and getrefcount's own.
+    if isinstance(old, SIZED_TYPES) and sys.getrefcount(old) <= 4:
+        context.release(old)
+
+
+def _charge(context, cost):
+    if cost:
+        context.increment_operations(cost)
+
+
+def _charge_size(node, context, left, right, result):
+    cost_model = context.cost_model
+    if cost_model is not None:
+        _charge(context, cost_model.binary_cost(node, left, right, result))
+
+
+# Nodes use __slots__ and hold their children in tuples, thousands of
+# resident scripts add up. Subclasses must declare __slots__ too, even
+# when empty, or every instance gets a __dict__ again.
 
 class Node(object):
 
+    # weakly referenced by the interner, see intern.py
+    __slots__ = ('line_num', '__weakref__')
+
     def __init__(self, line_num):
         self.line_num = line_num
-        pass
 
     def __str__(self):
         return self.__repr__()
@@ -15,6 +56,8 @@ class Node(object):
 
 class NopNode(Node):
 
+    __slots__ = ()
+
     def reduce(self, context):
         context.increment_operations()
         return None
@@ -25,6 +68,8 @@ class NopNode(Node):
 
 class LiteralNode(Node):
 
+    __slots__ = ('value',)
+
     def __init__(self, line_num, value):
         super(LiteralNode, self).__init__(line_num)
         self.value = value
@@ -37,22 +82,22 @@ class LiteralNode(Node):
         return self.value
 
 
-class Branch(list):
+class Branch(tuple):
+
+    # Nodes are never changed once parsed, everything a run changes
+    # lives in the context, so one tree can be executed by many threads
 
-    def __init__(self, *args, **kwargs):
-        self.return_value = None
-        super(Branch, self).__init__(*args, **kwargs)
+    __slots__ = ()
 
     def __repr__(self):
         return '[%s]' % (", ".join(map(lambda i: i.__repr__(), self)))
 
-    def set_return(self, node):
-        self.return_value = node
-
     def execute(self, context):
+        if context.profiler is not None:
+            return context.profiler.execute_branch(self, context)
         for node in self:
             try:
-                logging.debug("Executing branch with context: %s" % context)
+                logging.debug("Executing branch with context: %s", context)
                 node.reduce(context)
             except exceptions.ReturnRequestedException:
                 break
@@ -61,24 +106,29 @@ class Branch(list):
         return context.return_value
 
 
+# shared by every node without statements, e.g. ifs without an else
+EMPTY_BRANCH = Branch()
+
+
+def make_branch(statements):
+    if not statements:
+        return EMPTY_BRANCH
+    if type(statements) is Branch:
+        return statements
+    return Branch(statements)
+
+
 class IfNode(Node):
 
-    def __init__(self, line_num, condition, then=[], else_branch=[]):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+
+    def __init__(self, line_num, condition, then=EMPTY_BRANCH,
+                 else_branch=EMPTY_BRANCH):
         self.condition = condition
-        if then == []:
-            then = Branch([])
-        if else_branch == []:
-            else_branch = Branch([])
-        self.then_branch = then
-        self.else_branch = else_branch
+        self.then_branch = make_branch(then)
+        self.else_branch = make_branch(else_branch)
         super(IfNode, self).__init__(line_num)
 
-    def add_then(self, then_statement):
-        self.then_branch.append(then_statement)
-
-    def add_else(self, else_statement):
-        self.else_branch.append(else_statement)
-
     def __repr__(self):
         return '<If: %s Then: %s Else: %s>' % \
             (self.condition, self.then_branch, self.else_branch)
@@ -95,9 +145,11 @@ class IfNode(Node):
 
 class WhileNode(Node):
 
-    def __init__(self, line_num, condition, branch=Branch()):
+    __slots__ = ('condition', 'branch')
+
+    def __init__(self, line_num, condition, branch=EMPTY_BRANCH):
         self.condition = condition
-        self.branch = branch
+        self.branch = make_branch(branch)
         super(WhileNode, self).__init__(line_num)
 
     def __repr__(self):
@@ -108,7 +160,7 @@ class WhileNode(Node):
         logging.debug("Running while loop")
         while True:
             result = self.condition.reduce(context)
-            logging.debug("While result: %s" % result)
+            logging.debug("While result: %s", result)
             if not result:
                 break
             self.branch.execute(context)
@@ -117,10 +169,12 @@ class WhileNode(Node):
 
 class ForNode(Node):
 
-    def __init__(self, line_num, local_name, iterable, branch=Branch()):
+    __slots__ = ('local_name', 'iterable', 'branch')
+
+    def __init__(self, line_num, local_name, iterable, branch=EMPTY_BRANCH):
         self.local_name = local_name
         self.iterable = iterable
-        self.branch = branch
+        self.branch = make_branch(branch)
         super(ForNode, self).__init__(line_num)
 
     def __repr__(self):
@@ -138,6 +192,8 @@ class ForNode(Node):
 
 class UnaryOpNode(Node):
 
+    __slots__ = ('target',)
+
     def __init__(self, line_num, target):
         self.target = target
         super(UnaryOpNode, self).__init__(line_num)
@@ -157,6 +213,8 @@ class UnaryOpNode(Node):
 
 class BinaryOpNode(Node):
 
+    __slots__ = ('left', 'right')
+
     def __init__(self, line_num, left, right):
         self.left = left
         self.right = right
@@ -182,24 +240,40 @@ class BinaryOpNode(Node):
 
 class AdditionNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
-        return operator.add(left, right)
+        result = operator.add(left, right)
+        if not isinstance(result, Number):
+            # numbers are small, strings and containers can grow
+            context.allocate(result)
+        _charge_size(self, context, left, right, result)
+        return result
 
 
 class SubtractionNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         return operator.sub(left, right)
 
 
 class MultiplicationNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
+        if context.cost_model is not None:
+            _charge(context, context.cost_model.multiplication_cost(
+                self, left, right))
         return operator.mul(left, right)
 
 
 class DivisionNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         logging.debug("%s %s", left, right)
         return operator.div(left, right)
@@ -207,21 +281,32 @@ class DivisionNode(BinaryOpNode):
 
 class ExponentNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
+        if context.cost_model is not None:
+            # charged up front, computing a huge power is the expensive part
+            _charge(context, context.cost_model.exponent_cost(
+                self, left, right))
         return operator.pow(left, right)
 
 
 class AssignmentNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def reduce(self, context):
         context.increment_operations()
-        logging.debug("AssignmentNode: I am a %s" % self)
+        logging.debug("AssignmentNode: I am a %s", self)
         logging.debug("AssignmentNode: Left: %s Right: %s", self.left, self.right)
         result = self.right.reduce(context)
-        logging.debug("Assignment result: %s" % result)
+        logging.debug("Assignment result: %s", result)
         if not isinstance(self.left, SubscriptNotationNode):
             logging.debug("Left is not a subscript, assign the left name in context the result")
+            old = dict.get(context, self.left.name)
             context[self.left.name] = result
+            if old is not None:
+                _release(context, old)
         else:
             logging.debug("Dict member doesn't exist yet, so set it")
             # This dict member doesn't exist yet, set it.
@@ -232,7 +317,16 @@ class AssignmentNode(BinaryOpNode):
                 logging.debug("Attempting to set context[%s][%s] = result",
                               subscript.left, index)
                 logging.debug("Right value is %s", subscript.right.value)
-                context[subscript.left.name][index] = result
+                target = context[subscript.left.name]
+                old = None
+                if isinstance(target, containers.DICT_TYPES):
+                    if index in target:
+                        old = target[index]
+                    else:
+                        context.state.allocate(containers.DICT_ENTRY_SIZE)
+                target[index] = result
+                if old is not None:
+                    _release(context, old)
             except KeyError:
                 logging.error("Could not find the variable")
                 # make this more specific later TODO
@@ -241,6 +335,8 @@ class AssignmentNode(BinaryOpNode):
 
 class ComparisonNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         logging.debug("Left: %s   Right: %s", repr(left), repr(right))
         return operator.eq(left, right)
@@ -248,36 +344,48 @@ class ComparisonNode(BinaryOpNode):
 
 class LessThanNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         return operator.lt(left, right)
 
 
 class GreaterThanNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         return operator.gt(left, right)
 
 
 class GreaterThanEqualToNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         return operator.ge(left, right)
 
 
 class LessThanEqualToNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, left, right, context):
         return operator.le(left, right)
 
 
 class NegationNode(UnaryOpNode):
 
+    __slots__ = ()
+
     def operation(self, target, context):
         return operator.mul(-1, target)
 
 
 class NumberNode(LiteralNode):
 
+    __slots__ = ()
+
     def __init__(self, line_num, number_string):
         self.value = Decimal(number_string)
         self.line_num = line_num
@@ -289,6 +397,8 @@ class NumberNode(LiteralNode):
 
 class StringNode(LiteralNode):
 
+    __slots__ = ()
+
     def __init__(self, line_num, string):
         logging.debug("Assigning '%s' to %s" % (string, self.__class__))
         super(StringNode, self).__init__(line_num, string)
@@ -303,6 +413,8 @@ class StringNode(LiteralNode):
 
 class VariableNode(LiteralNode):
 
+    __slots__ = ('name',)
+
     def reduce(self, context):
         context.increment_operations()
         if self.name in context:
@@ -320,6 +432,8 @@ class VariableNode(LiteralNode):
 
 class BooleanNode(Node):
 
+    __slots__ = ('value',)
+
     def __init__(self, line_num, value):
         self.value = value
         super(BooleanNode, self).__init__(line_num)
@@ -333,12 +447,13 @@ class BooleanNode(Node):
 
 class SubscriptNotationNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def reduce(self, context):
         context.increment_operations()
         logging.debug("Reducing subscript notation")
         left = self.left.reduce(context)
-        if not isinstance(left, dict) and \
-                not isinstance(left, list):
+        if not isinstance(left, containers.CONTAINER_TYPES):
             raise exceptions.SaulRuntimeError(self.line_num,
                 "Subscript notation must be used with a "
                 "list or dictionary (Got %s)" % self.left.__class__)
@@ -348,6 +463,8 @@ class SubscriptNotationNode(BinaryOpNode):
 
 class DotNotationNode(BinaryOpNode):
 
+    __slots__ = ()
+
     def reduce(self, context):
         logging.debug("context type: %s", type(context))
         logging.debug("Context: %s", context)
@@ -355,7 +472,7 @@ class DotNotationNode(BinaryOpNode):
         logging.debug("Resolving dot notation")
         dictthing = self.left.reduce(context)
         logging.debug("Dot notation left side: %s", dictthing)
-        if type(dictthing) != dict:
+        if not isinstance(dictthing, containers.DICT_TYPES):
             raise exceptions.SaulRuntimeError(self.line_num,
                 "Dot notation used with non-dictionary: %s" %
                 dictthing)
@@ -371,16 +488,52 @@ class DotNotationNode(BinaryOpNode):
                                               (self.right.name, dictthing))
 
 
-class DictionaryNode(dict):
+class DictionaryNode(Node):
 
-    def __init__(self, line_num, *args, **kwargs):
-        self.line_num = line_num
-        super(DictionaryNode, self).__init__(*args, **kwargs)
+    # keys and value nodes in source order, a later duplicate key wins
+    __slots__ = ('key_names', 'value_nodes')
+
+    def __init__(self, line_num, items=()):
+        keys = []
+        values = []
+        positions = {}
+        for key, value in items:
+            if key in positions:
+                values[positions[key]] = value
+            else:
+                positions[key] = len(keys)
+                keys.append(key)
+                values.append(value)
+        self.key_names = tuple(keys)
+        self.value_nodes = tuple(values)
+        super(DictionaryNode, self).__init__(line_num)
 
     def reduce(self, context):
         context.increment_operations()
+        if context.cost_model is not None:
+            context.increment_operations(
+                context.cost_model.literal_cost(self, len(self)))
         logging.debug("Reducing dictionary")
-        return {k: self[k].reduce(context) for k in self}
+        result = containers.CowDict.wrap(dict(zip(
+            self.key_names,
+            [value.reduce(context) for value in self.value_nodes])))
+        context.allocate(result)
+        return result
+
+    def keys(self):
+        return list(self.key_names)
+
+    def values(self):
+        return list(self.value_nodes)
+
+    def iteritems(self):
+        return iter(zip(self.key_names, self.value_nodes))
+
+    def __len__(self):
+        return len(self.key_names)
+
+    def __iter__(self):
+        return iter(self.key_names)
 
     def __repr__(self):
         return "{%s}" % ", ".join(
@@ -390,11 +543,19 @@ class DictionaryNode(dict):
         return self.__repr__()
 
 
-class ListNode(list):
+class ListNode(tuple):
+
+    __slots__ = ()
 
     def reduce(self, context):
         context.increment_operations()
-        return [item.reduce(context) for item in self]
+        if context.cost_model is not None:
+            context.increment_operations(
+                context.cost_model.literal_cost(self, len(self)))
+        result = containers.CowList.wrap(
+            [item.reduce(context) for item in self])
+        context.allocate(result)
+        return result
 
     def get_node(self):
         return self
@@ -402,51 +563,22 @@ class ListNode(list):
 
 class FunctionNode(Node):
 
-    def __init__(self, line_num, context_class, signature=[], branch=Branch()):
-        self.branch = branch
-        self.signature = signature
+    __slots__ = ('branch', 'signature', 'context_class')
+
+    def __init__(self, line_num, context_class, signature=(),
+                 branch=EMPTY_BRANCH):
+        self.branch = make_branch(branch)
+        self.signature = tuple(signature)
         self.context_class = context_class
         super(FunctionNode, self).__init__(line_num)
 
     def reduce(self, context):
         context.increment_operations()
-
-        def closure(*args):
-            logging.debug("Arguments supplied during closure: %s" % repr(args))
-            context.reset_instrumentation()
-            # Copy the function's context so assignments
-            # are thrown away when done
-            execution_context = self.context_class()
-            execution_context.update(context)
-            logging.debug("This function's execution context is %s" %
-                          execution_context)
-            # include the function arguments
-            # in the current execution context
-            for index, name_identifier in enumerate(self.signature):
-                # grab the argument from the invocation's
-                # argument list, reduce each of them,
-                # and set the execution context item that
-                # corresponds to this function's signature
-                logging.debug("Examining function argument: %d, %s", index, name_identifier)
-                try:
-                    execution_context[name_identifier] = \
-                        args[index].reduce(context)
-                except IndexError:
-                    raise exceptions.SaulRuntimeError(self.line_num,
-                        "Not enough arguments supplied.")
-                except AttributeError:
-                    logging.debug("Received AttributeError, which means the value is a Python value. (%s)", name_identifier)
-                    logging.debug("repr of the value: %s", repr(args[index]))
-                    execution_context[name_identifier] = args[index]
-            # execute the branch
-            logging.debug("Execution context after argument binding: %s", repr(execution_context))
-            return_node = self.branch.execute(execution_context)
-            # add the result here
-            logging.debug("Function executed. Result: %s\nIncrementing operations", return_node)
-            context.increment_operations(execution_context.operations_counted)
-            return return_node
+        if context.memo_size > 0 and context.is_pure(self):
+            logging.debug("Function is pure, returning memoized closure")
+            return MemoizedFunction(self, context)
         logging.debug("Returning closure")
-        return closure
+        return ScriptFunction(self, context)
 
     def __str__(self):
         arglist = ", ".join(self.signature)
@@ -456,8 +588,97 @@ class FunctionNode(Node):
         return self.__str__()
 
 
+class ScriptFunction(object):
+
+    __slots__ = ('node', 'context')
+
+    def __init__(self, node, context):
+        self.node = node
+        self.context = context
+
+    def bind(self, context):
+        # the same function, resolving outer names in another context
+        return self.__class__(self.node, context)
+
+    def __call__(self, *args):
+        node, context = self.node, self.context
+        logging.debug("Arguments supplied during closure: %r", args)
+        # Give the function its own layer for locals so assignments
+        # are thrown away when done
+        execution_context = context.local_context()
+        logging.debug("This function's execution context is %s",
+                      execution_context)
+        # include the function arguments
+        # in the current execution context
+        for index, name_identifier in enumerate(node.signature):
+            # grab the argument from the invocation's
+            # argument list, reduce each of them,
+            # and set the execution context item that
+            # corresponds to this function's signature
+            logging.debug("Examining function argument: %d, %s", index, name_identifier)
+            try:
+                execution_context[name_identifier] = \
+                    args[index].reduce(context)
+            except IndexError:
+                raise exceptions.SaulRuntimeError(node.line_num,
+                    "Not enough arguments supplied.")
+            except AttributeError:
+                logging.debug("Received AttributeError, which means the value is a Python value. (%s)", name_identifier)
+                logging.debug("repr of the value: %s", repr(args[index]))
+                execution_context[name_identifier] = args[index]
+        # execute the branch
+        logging.debug("Execution context after argument binding: %s", repr(execution_context))
+        # operations inside are counted on the execution state the
+        # local context shares with the caller
+        return_node = node.branch.execute(execution_context)
+        logging.debug("Function executed. Result: %s", return_node)
+        return return_node
+
+    def __repr__(self):
+        return repr(self.node)
+
+
+class MemoizedFunction(ScriptFunction):
+
+    __slots__ = ('cache',)
+
+    pure = True
+
+    def __init__(self, node, context, cache=None):
+        super(MemoizedFunction, self).__init__(node, context)
+        if cache is None:
+            # one cache per function definition, so running a script
+            # again on the same context keeps the warm cache
+            cache = context.memo_caches.get(node)
+            if cache is None:
+                cache = context.memo_caches[node] = LRUCache(
+                    context.memo_size)
+            cache.size = context.memo_size
+        self.cache = cache
+
+    def bind(self, context):
+        # pure functions don't read outer names, keep the warm cache but
+        # count operations against the new context
+        return self.__class__(self.node, context, self.cache)
+
+    def __call__(self, *args):
+        if not all(type(arg) in MEMOIZABLE_TYPES for arg in args):
+            return super(MemoizedFunction, self).__call__(*args)
+        key = call_key(args)
+        result = self.cache.get(key, _missing)
+        if result is not _missing:
+            self.context.increment_operations(self.context.memo_hit_cost)
+            return result
+        result = super(MemoizedFunction, self).__call__(*args)
+        if type(result) in MEMOIZABLE_TYPES:
+            self.cache.put(key, result)
+        return result
+
+
 class BoundFunctionNode(Node):
 
+    __slots__ = ('func',)
+
     def __init__(self, line_num, func):
         self.func = func
         super(BoundFunctionNode, self).__init__(line_num)
@@ -474,6 +695,8 @@ class BoundFunctionNode(Node):
 
 class ReturnNode(Node):
 
+    __slots__ = ('return_node',)
+
     def __init__(self, line_num, return_node):
         self.return_node = return_node
         super(ReturnNode, self).__init__(line_num)
@@ -489,9 +712,11 @@ class ReturnNode(Node):
 
 class InvocationNode(Node):
 
+    __slots__ = ('callable_name', 'arg_list')
+
     def __init__(self, line_num, callable_name, arg_list):
         self.callable_name = callable_name
-        self.arg_list = arg_list
+        self.arg_list = tuple(arg_list)
         super(InvocationNode, self).__init__(line_num)
 
     def reduce(self, context):
@@ -504,12 +729,32 @@ class InvocationNode(Node):
             logging.error('No function named ' + self.callable_name)
             raise exceptions.SaulRuntimeError(self.line_num, "%s is not defined" % self.callable_name)
         callable_item = context[self.callable_name]
-        logging.debug("Checking %s to see if it is callable" % callable_item)
+        logging.debug("Checking %s to see if it is callable", callable_item)
         if not callable(callable_item):
             raise exceptions.SaulRuntimeError(self.line_num, "%s is not callable" %
                                               callable_item)
         args = [arg.reduce(context) for arg in self.arg_list]
+        is_host = not isinstance(callable_item, ScriptFunction)
+        if is_host and context.function_costs:
+            cost = context.function_costs.get(callable_item)
+            if cost is not None:
+                if callable(cost):
+                    cost = cost(*args)
+                context.increment_operations(cost)
         try:
+            if is_host:
+                # timed, and may suspend a resumable script
+                result = context.call_host(
+                    self.callable_name, callable_item,
+                    [containers.unwrap(arg) for arg in args])
+                if isinstance(result, SIZED_TYPES):
+                    # charged like values the script builds, assigning
+                    # over it gives it back
+                    context.allocate(result)
+                return result
+            if context.profiler is not None:
+                return context.profiler.call_function(
+                    self.callable_name, callable_item, args, context)
             return callable_item(*args)
         except TypeError:
             raise exceptions.SaulRuntimeError(self.line_num, "Could not execute function")
@@ -0,0 +1,126 @@
+import logging
+import nodes
+
+
+class ImpureFunction(Exception):
+    pass
+
+
+def _local_names(node, names):
+    # every name the function body binds: assignment targets and loop variables
+    if isinstance(node, nodes.AssignmentNode) and \
+            isinstance(node.left, nodes.VariableNode):
+        names.add(node.left.name)
+    elif isinstance(node, nodes.ForNode):
+        names.add(node.local_name)
+    for child in _children(node):
+        _local_names(child, names)
+    return names
+
+
+def _children(node):
+    if isinstance(node, (nodes.Branch, nodes.ListNode)):
+        return list(node)
+    elif isinstance(node, nodes.DictionaryNode):
+        return node.values()
+    elif isinstance(node, nodes.IfNode):
+        return [node.condition, node.then_branch, node.else_branch]
+    elif isinstance(node, nodes.WhileNode):
+        return [node.condition, node.branch]
+    elif isinstance(node, nodes.ForNode):
+        return [node.iterable, node.branch]
+    elif isinstance(node, nodes.DotNotationNode):
+        # the right side is a key name, not a variable
+        return [node.left]
+    elif isinstance(node, nodes.BinaryOpNode):
+        return [node.left, node.right]
+    elif isinstance(node, nodes.UnaryOpNode):
+        return [node.target]
+    elif isinstance(node, nodes.ReturnNode):
+        return [node.return_node]
+    elif isinstance(node, nodes.InvocationNode):
+        return node.arg_list
+    return []
+
+
+class PurityChecker(object):
+
+    # Reads must be of arguments or of locals assigned on every path
+    # before the read, otherwise the read falls through the locals
+    # layer to a global whenever the assignment didn't happen.
+
+    def __init__(self, function_node, context):
+        self.function_node = function_node
+        self.context = context
+        self.arguments = frozenset(function_node.signature)
+        # names the body may bind, on any path
+        self.local_names = _local_names(function_node.branch, set())
+
+    def is_local(self, name):
+        return name in self.arguments or name in self.local_names
+
+    def check_callee(self, name):
+        if self.is_local(name) or name not in self.context:
+            raise ImpureFunction("call to unknown function %s" % name)
+        if name in self.context.pure_functions:
+            return
+        if getattr(self.context[name], 'pure', False):
+            return
+        raise ImpureFunction("call to impure function %s" % name)
+
+    def check(self, node, assigned):
+        # assigned holds the names definitely bound before node runs,
+        # the names definitely bound after it are returned
+        if isinstance(node, nodes.Branch):
+            for child in node:
+                assigned = self.check(child, assigned)
+            return assigned
+        elif isinstance(node, (nodes.FunctionNode, nodes.BoundFunctionNode)):
+            raise ImpureFunction("nested function definition")
+        elif isinstance(node, nodes.AssignmentNode):
+            if not isinstance(node.left, nodes.VariableNode):
+                # subscript assignment may mutate an argument or a global
+                raise ImpureFunction("assignment to %s" % node.left)
+            if node.left.name not in self.arguments and \
+                    node.left.name in self.context:
+                raise ImpureFunction("assignment to outer name %s" %
+                                     node.left.name)
+            self.check(node.right, assigned)
+            return assigned | frozenset([node.left.name])
+        elif isinstance(node, nodes.IfNode):
+            self.check(node.condition, assigned)
+            then_assigned = self.check(node.then_branch, assigned)
+            else_assigned = self.check(node.else_branch, assigned)
+            return then_assigned & else_assigned
+        elif isinstance(node, nodes.WhileNode):
+            # the body may not run at all
+            self.check(node.condition, assigned)
+            self.check(node.branch, assigned)
+            return assigned
+        elif isinstance(node, nodes.ForNode):
+            if node.local_name not in self.arguments and \
+                    node.local_name in self.context:
+                raise ImpureFunction("loop variable shadows outer name %s" %
+                                     node.local_name)
+            self.check(node.iterable, assigned)
+            self.check(node.branch, assigned | frozenset([node.local_name]))
+            return assigned
+        elif isinstance(node, nodes.VariableNode):
+            if node.name not in self.arguments and node.name not in assigned:
+                raise ImpureFunction("read of outer name %s" % node.name)
+            return assigned
+        elif isinstance(node, nodes.InvocationNode):
+            self.check_callee(node.callable_name)
+        for child in _children(node):
+            self.check(child, assigned)
+        return assigned
+
+
+def is_pure(function_node, context):
+    try:
+        PurityChecker(function_node, context).check(function_node.branch,
+                                                     frozenset())
+    except ImpureFunction as e:
+        logging.debug("Function %s is impure: %s", function_node, e)
+        return False
+    return True
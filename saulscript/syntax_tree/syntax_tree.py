@@ -17,9 +17,14 @@ class SyntaxTree(object):
         self.token_counter = 0
 
     def execute(self, context, time_limit=-1, op_limit=-1):
+        # safe to call from several threads at once as long as each
+        # passes its own context, running a tree doesn't change it
         context.set_op_limit(op_limit)
         context.set_time_limit(time_limit)
 
+        if context.profiler is not None:
+            context.profiler.execute_branch(self.tree, context)
+            return context
         for expression in self.tree:
             expression.reduce(context)
         return context
@@ -44,9 +49,11 @@ class SyntaxTree(object):
     def unshift_token(self, item):
         return self.tokens.insert(0, item)
 
-    def __init__(self, context_class, tokens):
+    def __init__(self, context_class, tokens, interner=None):
         self.tokens = tokens
-        self.tree = nodes.Branch([])
+        # an intern.Interner shares identical subtrees between scripts
+        self.interner = interner
+        self.tree = nodes.EMPTY_BRANCH
         self.line_num = 0
         self.context_class = context_class
         self.token_counter = 0
@@ -56,19 +63,23 @@ class SyntaxTree(object):
             token.body == body
 
     def run(self):
+        statements = []
         while True:
             try:
                 # look ahead and if there is a binaryoperator in our future,
                 # handle it
-                self.tree.append(self.handle_expression())
+                statements.append(self.handle_expression())
             except exceptions.OutOfTokens as e:
                 self._debug('*** Out of tokens: %s', e.message)
-                for line in self.tree:
+                for line in statements:
                     self._debug("FINAL AST: %s", line)
                 break
             except exceptions.EndContextExecution:
                 logging.error('Unexpected }')
                 raise exceptions.ParseError(self.line_num, "Unexpected }")
+        if self.interner is not None:
+            statements = [self.interner.intern(node) for node in statements]
+        self.tree = nodes.make_branch(statements)
 
     def dump(self):
         for line_num, branch in enumerate(self.tree):
@@ -94,7 +105,7 @@ class SyntaxTree(object):
             raise exceptions.ParseError(self.line_num, "Expected {, got %s" % self.next_token)
         self.shift_token()  # get rid of {
 
-        new_branch = nodes.Branch()
+        new_branch = []
         while True:
             try:
                 new_branch.append(self.handle_expression())
@@ -125,7 +136,7 @@ class SyntaxTree(object):
         while True:
             token = self.next_token
             self._debug("Current argument set: %s", repr(arg_tokens))
-            self._debug("Function Invocation: Consider %s" % token)
+            self._debug("Function Invocation: Consider %s", token)
             if isinstance(token, tokens.RightParenToken):
                 self.shift_token()
                 break
@@ -145,7 +156,7 @@ class SyntaxTree(object):
     def handle_list_expression(self):
         self._debug("Handling a list expression")
         self.shift_token()  # get rid of [
-        data = nodes.ListNode()
+        data = []
         while isinstance(self.next_token, tokens.LineTerminatorToken):
             # ignore line breaks here until we see data
             self.shift_token()
@@ -162,12 +173,13 @@ class SyntaxTree(object):
                 self.shift_token()
             if expression is not None:
                 data.append(expression)
-        return data
+        return nodes.ListNode(data)
 
     def handle_dictionary_expression(self):
         self._debug("Handling a dictionary expression")
         self.shift_token()  # get rid of {
-        data = nodes.DictionaryNode(self.line_num)
+        line_num = self.line_num
+        data = []
         while True:
             name = self.shift_token()
             if isinstance(name, tokens.LineTerminatorToken):
@@ -189,8 +201,8 @@ class SyntaxTree(object):
             # Goes until the end of a line. No comma needed!
             expression = self.handle_operator_expression()
             if expression is not None:
-                data[name.body] = expression
-        return data
+                data.append((name.body, expression))
+        return nodes.DictionaryNode(line_num, data)
 
     def handle_operator_expression(self):
         self._debug("Handling operator expression.")
@@ -350,7 +362,7 @@ class SyntaxTree(object):
         while True:
             try:
                 token = output.pop(0)
-                self._debug("Consider %s from output" % token)
+                self._debug("Consider %s from output", token)
             except IndexError:
                 break
             if not isinstance(token, tokens.OperatorToken):
@@ -371,7 +383,7 @@ class SyntaxTree(object):
                     self._debug("%s is unary", token)
                     target = tree_stack.pop()
                     tree_stack.append(token.get_node(self.line_num, target))
-        self._debug("%s" % tree_stack)
+        self._debug("%s", tree_stack)
         if len(tree_stack) != 1:
             logging.error("Tree stack length is not 1. Contents: %s",
                           tree_stack)
@@ -394,7 +406,7 @@ class SyntaxTree(object):
                 return nodes.BooleanNode(self.line_num, True)
             elif token.body == 'false':
                 return nodes.BooleanNode(self.line_num, False)
-            self._debug("Deciding that %s is a variable" % token)
+            self._debug("Deciding that %s is a variable", token)
             return nodes.VariableNode(self.line_num, token.body)
         elif isinstance(token, tokens.NumberLiteralToken):
             return nodes.NumberNode(self.line_num, token.body)
@@ -430,7 +442,7 @@ class SyntaxTree(object):
                 raise exceptions.ParseError(self.line_num)
 
     def handler_exists(self, token):
-        self._debug("* Checking if there is a handler for %s" % token)
+        self._debug("* Checking if there is a handler for %s", token)
         method_name = 'handle_identifier_' + token.body
         return hasattr(self, method_name)
 
@@ -443,8 +455,8 @@ class SyntaxTree(object):
     def handle_identifier_if(self, token):
         self._debug("Handling IF")
         condition = self.handle_operator_expression()
-        then_branch = nodes.Branch([])
-        else_branch = nodes.Branch([])
+        then_branch = []
+        else_branch = []
         while not isinstance(self.next_token, tokens.IdentifierToken) or \
                 self.next_token.body not in ['else', 'end']:
             self._debug("Checking next expression as part of THEN clause")
@@ -503,7 +515,7 @@ class SyntaxTree(object):
     def handle_identifier_while(self, token):
         self._debug("Handling while loop")
         condition = self.handle_operator_expression()
-        branch = nodes.Branch()
+        branch = []
         try:
             while not isinstance(self.next_token, tokens.IdentifierToken) or \
                     self.next_token.body not in ['end']:
@@ -538,12 +550,12 @@ class SyntaxTree(object):
             raise exceptions.ParseError(self.line_num, "Expected 'in', got %s" % token)
 
         iterable = self.handle_operator_expression()
-        self._debug("The iterable is %s" % iterable)
-        branch = nodes.Branch()
+        self._debug("The iterable is %s", iterable)
+        branch = []
         try:
             while not isinstance(self.next_token, tokens.IdentifierToken) or \
                     self.next_token.body not in ['end']:
-                self._debug("For Loop: Consider %s" % self.next_token)
+                self._debug("For Loop: Consider %s", self.next_token)
                 try:
                     branch.append(self.handle_expression())
                     self._debug(
@@ -0,0 +1,130 @@
+from collections import deque
+from decimal import Decimal
+from saulscript import Context
+from saulscript.exceptions import SaulRuntimeError
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+# Scripts suspended on awaitable host calls: a suspended statement is
+# run again with the host results replayed, it must be charged once
+# and must not repeat side effects of script functions.
+
+
+class Future(object):
+    # resolves on the next turn of Loop
+
+    def __init__(self, loop, value):
+        self.value = value
+        self.callbacks = []
+        loop.call_soon(self.resolve)
+
+    def resolve(self):
+        for callback in self.callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def result(self):
+        return self.value
+
+
+class ScriptFuture(object):
+
+    def __init__(self):
+        self.finished = False
+
+    def done(self):
+        return self.finished
+
+    def set_result(self, value):
+        self.finished, self.value, self.error = True, value, None
+
+    def set_exception(self, error):
+        self.finished, self.value, self.error = True, None, error
+
+
+class Loop(object):
+
+    def __init__(self):
+        self.queue = deque()
+
+    def create_future(self):
+        return ScriptFuture()
+
+    def call_soon(self, func, *args):
+        self.queue.append((func, args))
+
+    call_soon_threadsafe = call_soon
+
+    def run_until(self, future):
+        while not future.done():
+            func, args = self.queue.popleft()
+            func(*args)
+
+
+loop = Loop()
+
+
+def run_async(src, **functions):
+    context = Context()
+    for name, func in functions.iteritems():
+        context.bind_function(name, func)
+    future = context.execute_async(src, loop=loop, slice_ops=50)
+    loop.run_until(future)
+    return context, future
+
+
+LOOP = '''
+t = 0
+i = 0
+while i < 100
+    i = i + 1
+    t = t + fetch(i) + fetch(1)
+end while
+'''
+
+# suspending doesn't charge the statement again
+sync = Context()
+sync.bind_function('fetch', lambda n: n * 2)
+sync.execute(LOOP)
+context, future = run_async(LOOP, fetch=lambda n: Future(loop, n * 2))
+assert future.error is None, future.error
+assert context['t'] == sync['t']
+assert context.operations_counted == sync.operations_counted, (
+    context.operations_counted, sync.operations_counted)
+
+# awaiting inside a script function would run the function again
+BUMP = '''
+d = {n: 0}
+bump = function(m) {
+    m['n'] = m['n'] + 1
+    return fetch(1) + fetch(2)
+}
+x = bump(d)
+'''
+context, future = run_async(BUMP, fetch=lambda n: Future(loop, n))
+assert isinstance(future.error, SaulRuntimeError), future.error
+assert context['d']['n'] == 1
+
+# nor can a statement calling one await anything, double would run twice
+context, future = run_async('''
+double = function(a) {
+    return a * 2
+}
+x = double(fetch(2)) + fetch(3)
+''', fetch=lambda n: Future(loop, n) if n == 3 else n)
+assert isinstance(future.error, SaulRuntimeError), future.error
+
+# awaiting in a statement of its own is fine
+context, future = run_async('''
+double = function(a) {
+    return a * 2
+}
+y = fetch(3)
+x = double(y)
+''', fetch=lambda n: Future(loop, n))
+assert future.error is None and context['x'] == Decimal(6)
+
+print "ok"
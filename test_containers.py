@@ -0,0 +1,107 @@
+from decimal import Decimal
+from saulscript import Context, HostBindings
+import json
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+# Script lists and dicts are copy-on-write containers, they have to
+# behave like the plain ones scripts and host functions used to get.
+
+
+def run(src, context=None):
+    context = context or Context()
+    context.execute(src)
+    return context
+
+
+ctx = run('''
+a = [1, 2]
+b = a + [3]
+c = [0] + a
+d = {k: 1, j: 2}
+e = d.k + d['j']
+f = b[2]
+b[0] = 9
+''')
+assert ctx['a'] == [1, 2]
+assert ctx['b'] == [9, 2, 3]
+assert ctx['c'] == [0, 1, 2]
+assert ctx['e'] == 3
+assert ctx['f'] == 3
+
+# plain lists on either side
+assert ctx['a'] + [3] == [1, 2, 3]
+assert [0] + ctx['a'] == [0, 1, 2]
+
+# forks don't see each other's writes
+base = Context()
+base.execute('''
+items = [1, 2, 3]
+table = {k: 1}
+table['inner'] = [1]
+''')
+frozen = base.snapshot()
+one = frozen.fork()
+two = frozen.fork()
+one.execute('''
+items[0] = 100
+table['k'] = 5
+inner = table.inner
+inner[0] = 7
+''')
+two.execute('''
+x = items[0] + table.k
+''')
+assert two['x'] == 2, two['x']
+assert frozen['items'] == [1, 2, 3]
+assert frozen['table']['inner'] == [1]
+assert one['items'][0] == 100 and one['table']['k'] == 5
+assert one['table']['inner'] == [7]
+
+# so do values the host bound
+base = Context()
+base.bind_value('inv', {'gold': Decimal(1), 'bag': [Decimal(2)]})
+frozen = base.snapshot()
+one = frozen.fork()
+two = frozen.fork()
+one.execute('''
+inv['gold'] = 99
+bag = inv.bag
+bag[0] = 5
+''')
+assert one['inv']['gold'] == 99 and one['inv']['bag'] == [5]
+assert two['inv']['gold'] == 1 and two['inv']['bag'] == [2]
+assert base['inv']['gold'] == 1 and base['inv']['bag'] == [2]
+
+lib = HostBindings()
+lib.bind_value('inv', {'gold': Decimal(1)})
+lib.freeze()
+one = Context(bindings=lib)
+one.execute("inv['gold'] = 99\n")
+assert one['inv']['gold'] == 99
+assert Context(bindings=lib)['inv']['gold'] == 1
+
+# host functions get plain containers
+seen = []
+
+
+def host(value):
+    seen.append(value)
+    return Decimal(len(json.dumps(value, default=str)))
+
+ctx = Context()
+ctx.bind_function('host', host)
+ctx.execute('''
+d = {k: 1}
+d['k'] = [1, 2]
+n = host(d)
+e = {j: 2}
+l = [1, 2]
+l[1] = e
+m = host(l)
+''')
+assert type(seen[0]) is dict and type(seen[0]['k']) is list
+assert type(seen[1]) is list and type(seen[1][1]) is dict
+
+print "ok"
@@ -0,0 +1,115 @@
+from decimal import Decimal
+from saulscript import Context
+from saulscript.syntax_tree.nodes import MemoizedFunction
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+# Memoized script functions must give the same results as plain ones,
+# so anything that can make a call depend on more than its arguments
+# has to make the function impure.
+
+
+def run(src, **functions):
+    context = Context()
+    context.set_memoization(16)
+    for name, func in functions.iteritems():
+        context.bind_function(name, func)
+    context.execute(src)
+    return context
+
+
+def memoized(context, name):
+    return isinstance(context[name], MemoizedFunction)
+
+
+# a name assigned on some paths only falls through to the global
+ctx = run('''
+f = function(a) {
+    if a > 5
+        bonus = 1
+    end if
+    return a + bonus
+}
+bonus = 100
+r1 = f(1)
+bonus = 200
+r2 = f(1)
+''')
+assert not memoized(ctx, 'f')
+assert ctx['r1'] == 101 and ctx['r2'] == 201
+
+# assigned before the read on every path is local
+ctx = run('''
+g = function(a) {
+    t = a * 2
+    if a > 5
+        t = 1
+    end if
+    return a + t
+}
+r1 = g(1)
+r2 = g(1)
+''')
+assert memoized(ctx, 'g')
+assert ctx['r1'] == 3 and ctx['r2'] == 3
+assert ctx.memo_stats()['hits'] == 1
+
+# reading an outer name
+ctx = run('''
+scale = 2
+h = function(a) {
+    return a * scale
+}
+r1 = h(3)
+scale = 3
+r2 = h(3)
+''')
+assert not memoized(ctx, 'h')
+assert ctx['r1'] == 6 and ctx['r2'] == 9
+
+# calling an impure host function
+counter = [0]
+
+
+def tick():
+    counter[0] += 1
+    return Decimal(counter[0])
+
+ctx = run('''
+k = function(a) {
+    return a + tick()
+}
+r1 = k(1)
+r2 = k(1)
+''', tick=tick)
+assert not memoized(ctx, 'k')
+assert ctx['r1'] == 2 and ctx['r2'] == 3
+
+# the same call to a pure one is fine
+ctx = Context()
+ctx.set_memoization(16)
+ctx.bind_function('double', lambda n: n * 2, pure=True)
+ctx.execute('''
+k = function(a) {
+    return a + double(a)
+}
+r1 = k(1)
+r2 = k(1)
+''')
+assert memoized(ctx, 'k') and ctx['r2'] == 3
+
+# subscript assignment to an argument
+ctx = run('''
+d = {n: 0}
+bump = function(m) {
+    m['n'] = m['n'] + 1
+    return 0
+}
+x = bump(d)
+y = bump(d)
+''')
+assert not memoized(ctx, 'bump')
+assert ctx['d']['n'] == 2
+
+print "ok"